@@ -0,0 +1,26 @@
+"""Crash-safe file writes: write to a temporary file in the same directory, then os.replace()."""
+import os
+import threading
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = 'wb'):
+    """
+    Open a temporary file next to `path` and move it over `path` on success.
+
+    Readers see either the old file or the complete new one, never a
+    partially written file. On error the temporary file is removed and
+    `path` is left untouched.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
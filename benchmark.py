@@ -0,0 +1,298 @@
+"""Benchmark suite: startup, routing latency/throughput, worker memory and orchestrate() throughput.
+
+OpenRouter calls go to the bundled mock (mock_openrouter.py), so no API key
+or network is needed. Results are written as JSON; pass --compare with an
+earlier results file to flag regressions between commits.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --suites routing,orchestrate --concurrency 1,8,32 --compare bench.json
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import numpy as np
+from typing import Dict, List
+
+from mock_openrouter import MockOpenRouter
+
+SUITES = ('startup', 'routing', 'memory', 'orchestrate')
+
+TEMPLATES = [
+    "Explain {} to a 10 year old",
+    "Summarize the key ideas of {}",
+    "Write a short poem about {}",
+    "Prove a basic result about {}",
+    "Write Python code that demonstrates {}",
+    "What are the pros and cons of {}?",
+    "Translate a sentence about {} into French",
+    "Give me a step-by-step plan to learn {}"
+]
+TOPICS = [
+    "gravity", "gradient descent", "photosynthesis", "black holes", "recursion", "the French revolution",
+    "hash tables", "vaccines", "inflation", "transformers", "plate tectonics", "sorting algorithms",
+    "climate change", "quantum entanglement", "the stock market", "neural networks"
+]
+
+# Cold start runs in a fresh interpreter so imports and file loads are not already cached in-process
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from router import Router
+imported = time.perf_counter() - start
+router = Router(sys.argv[1])
+timings = router.warmup()
+first = time.perf_counter()
+router.route_prompt('Explain gravity to a 10 year old')
+timings['first_route'] = time.perf_counter() - first
+timings['import'] = imported
+timings['total'] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def make_prompts(n: int, seed: int = 0) -> List[str]:
+    """`n` distinct synthetic prompts, the same for a given seed."""
+    rng = random.Random(seed)
+    return [f"{rng.choice(TEMPLATES).format(rng.choice(TOPICS))} (case {i})" for i in range(n)]
+
+
+def summarize(latencies: List[float], elapsed: float, items: int = None) -> Dict:
+    """Throughput and latency percentiles (milliseconds) for one measured run."""
+    latencies = np.asarray(latencies, dtype=np.float64) * 1000.0
+    items = len(latencies) if items is None else items
+    return {
+        'count': items,
+        'elapsed_seconds': elapsed,
+        'throughput_per_second': items / elapsed if elapsed > 0 else None,
+        'mean_ms': float(latencies.mean()) if len(latencies) else None,
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+        'p95_ms': float(np.percentile(latencies, 95)) if len(latencies) else None,
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None
+    }
+
+
+def bench_startup(config: str, runs: int) -> Dict:
+    """Cold import, load and warmup timings in fresh processes; medians over `runs`."""
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, config], check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: float(np.median([sample[key] for sample in samples])) for key in samples[0]}
+
+
+def bench_routing(config: str, n: int, batch_sizes: List[int], seed: int) -> Dict:
+    """route_prompt() one at a time (uncached and cached) and route_batch() at each batch size."""
+    from embedding_cache import EmbeddingCache
+    from router import Router
+
+    router = Router(config, embedding_cache=EmbeddingCache(max_entries=max(n, 1)))
+    router.warmup()
+    prompts = make_prompts(n, seed)
+    results = {}
+    for name in ('single', 'single_cached'):
+        latencies = []
+        start = time.perf_counter()
+        for prompt in prompts:
+            t = time.perf_counter()
+            router.route_prompt(prompt)
+            latencies.append(time.perf_counter() - t)
+        results[name] = summarize(latencies, time.perf_counter() - start)
+    results['stages'] = dict(router.stage_counts)
+
+    for batch_size in batch_sizes:
+        router = Router(config)
+        router.warmup()
+        batches = [prompts[i:i + batch_size] for i in range(0, n, batch_size)]
+        latencies = []
+        start = time.perf_counter()
+        for batch in batches:
+            t = time.perf_counter()
+            router.route_batch(batch, batch_size)
+            latencies.append(time.perf_counter() - t)
+        results[f'batch_{batch_size}'] = summarize(latencies, time.perf_counter() - start, items=n)
+    return results
+
+
+def bench_memory(processes: int, n: int, seed: int) -> Dict:
+    """RSS/PSS of this process and of each RoutingPool worker after routing `n` prompts."""
+    from routing_pool import RoutingPool
+
+    with RoutingPool(processes) as pool:
+        pool.route(make_prompts(n, seed))
+        workers = pool.memory()
+    parent = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'VmHWM'):
+                parent[key.lower() + '_kb'] = int(value.split()[0])
+    return {'parent': parent, 'workers': workers}
+
+
+def bench_orchestrate(concurrency_levels: List[int], n: int, stream: bool, seed: int) -> Dict:
+    """orchestrate() from a thread pool and orchestrate_async() under a semaphore, per concurrency level."""
+    import orchestrator
+
+    orchestrator.warmup()
+    results = {}
+    for level in concurrency_levels:
+        prompts = make_prompts(n, seed + level)
+
+        def one(prompt):
+            t = time.perf_counter()
+            result = orchestrator.orchestrate(prompt, use_cache=False, stream=stream)
+            if stream:
+                ''.join(result['response'])
+            return time.perf_counter() - t
+
+        latencies, errors = [], 0
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=level) as pool:
+            for future in [pool.submit(one, prompt) for prompt in prompts]:
+                try:
+                    latencies.append(future.result())
+                except Exception:
+                    errors += 1
+        results[f'threads_{level}'] = {**summarize(latencies, time.perf_counter() - start), 'errors': errors}
+
+        prompts = make_prompts(n, seed + 1000 + level)
+        latencies, errors, elapsed = asyncio.run(_orchestrate_async(prompts, level, stream))
+        results[f'async_{level}'] = {**summarize(latencies, elapsed), 'errors': errors}
+    results['metrics'] = json.loads(orchestrator.export_metrics('json'))
+    return results
+
+
+async def _orchestrate_async(prompts: List[str], level: int, stream: bool):
+    import orchestrator
+
+    limit = asyncio.Semaphore(level)
+    latencies, errors = [], 0
+
+    async def one(prompt):
+        nonlocal errors
+        async with limit:
+            t = time.perf_counter()
+            try:
+                result = await orchestrator.orchestrate_async(prompt, use_cache=False, stream=stream)
+                if stream:
+                    async for _ in result['response']:
+                        pass
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - t)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(prompt) for prompt in prompts))
+    return latencies, errors, time.perf_counter() - start
+
+
+def compare(previous: Dict, current: Dict, threshold: float = 0.10) -> List[str]:
+    """Lines describing latency/throughput figures that moved by more than `threshold` (relative)."""
+    def flatten(node, prefix=''):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                yield from flatten(value, f'{prefix}.{key}' if prefix else key)
+        elif isinstance(node, (int, float)) and not isinstance(node, bool):
+            yield prefix, float(node)
+
+    old = dict(flatten(previous.get('results', {})))
+    lines = []
+    for key, value in flatten(current.get('results', {})):
+        if key.endswith(('_ms', 'throughput_per_second')) and old.get(key):
+            change = (value - old[key]) / old[key]
+            if abs(change) > threshold:
+                worse = change < 0 if key.endswith('throughput_per_second') else change > 0
+                lines.append(f"{'REGRESSION' if worse else 'improved'} {key}: {old[key]:.3f} -> {value:.3f} "
+                             f"({change:+.1%})")
+    return lines
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Routing and orchestration benchmarks against a mock OpenRouter')
+    parser.add_argument('--config', default='knn_router.yaml')
+    parser.add_argument('--suites', default=','.join(SUITES), help=f"comma-separated subset of {', '.join(SUITES)}")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--prompts', type=int, default=512, help='prompts per routing / memory run')
+    parser.add_argument('--requests', type=int, default=200, help='orchestrate() calls per concurrency level')
+    parser.add_argument('--batch-sizes', default='1,8,32,128')
+    parser.add_argument('--concurrency', default='1,4,16,64')
+    parser.add_argument('--processes', type=int, default=2, help='RoutingPool workers for the memory suite')
+    parser.add_argument('--startup-runs', type=int, default=3)
+    parser.add_argument('--mock-latency-ms', type=float, default=50.0)
+    parser.add_argument('--mock-jitter-ms', type=float, default=0.0)
+    parser.add_argument('--mock-error-rate', type=float, default=0.0)
+    parser.add_argument('--mock-rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--stream', action='store_true', help='stream the orchestrate() responses')
+    parser.add_argument('--rate-limits', action='store_true',
+                        help='keep the client-side rate limits from the manifest (off by default)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    suites = [suite for suite in args.suites.split(',') if suite]
+
+    mock = MockOpenRouter(latency=args.mock_latency_ms / 1000.0, jitter=args.mock_jitter_ms / 1000.0,
+                          error_rate=args.mock_error_rate, rate_limit_rate=args.mock_rate_limit_rate,
+                          seed=args.seed).start()
+    # Set before orchestrator is imported; its client reads these once
+    os.environ['OPENROUTER_BASE_URL'] = mock.base_url
+    os.environ.setdefault('OPENROUTER_API_KEY', 'mock-key')
+    if 'orchestrate' in suites and not args.rate_limits:
+        import orchestrator
+        from rate_limiter import RateLimiter
+        orchestrator.router.limiter = RateLimiter()
+
+    results = {}
+    if 'startup' in suites:
+        print("[BENCH] startup")
+        results['startup'] = bench_startup(args.config, args.startup_runs)
+    if 'routing' in suites:
+        print("[BENCH] routing")
+        results['routing'] = bench_routing(args.config, args.prompts,
+                                           [int(b) for b in args.batch_sizes.split(',')], args.seed)
+    if 'memory' in suites:
+        print("[BENCH] memory")
+        results['memory'] = bench_memory(args.processes, args.prompts, args.seed)
+    if 'orchestrate' in suites:
+        print("[BENCH] orchestrate")
+        results['orchestrate'] = bench_orchestrate([int(c) for c in args.concurrency.split(',')],
+                                                   args.requests, args.stream, args.seed)
+    results['mock'] = dict(mock.counts)
+    mock.stop()
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args)
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"[BENCH] Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        for line in compare(previous, report) or ['No figure moved by more than 10%']:
+            print(f"[BENCH] {line}")
@@ -0,0 +1,123 @@
+"""Agreement check: lexical cascade decisions versus the MiniLM (embedding) decision, per cascade_margin.
+
+    python check_cascade.py
+    python check_cascade.py --prompts heldout.txt --margins 0.02,0.05,0.1
+
+Set `hparam.cascade_margin` only to a margin this check shows agreeing with
+the embedding stage on prompts the lexical centroids were not built from.
+"""
+import argparse
+import json
+import numpy as np
+from typing import Dict, List
+
+from router import Router, RoutingTable
+
+DEFAULT_MARGINS = [0.01, 0.02, 0.05, 0.1, 0.2]
+# Agreement a margin needs on the decided prompts before it is recommended
+MIN_AGREEMENT = 0.98
+# Fewer decided prompts than this are too few to judge a margin by
+MIN_DECIDED = 20
+
+heldout_prompts = [
+    "Summarize gravity",
+    "Prove convergence of gradient descent",
+    "Write a haiku about stars",
+    "Explain transformers to a 10 year old",
+    "Translate 'good morning' to Spanish",
+    "Derive the closed form of the Fibonacci sequence",
+    "List three uses of baking soda",
+    "Write a Python function that reverses a linked list",
+    "What is the capital of Australia?",
+    "Draft a polite email declining a meeting",
+    "Explain the difference between TCP and UDP",
+    "Solve for x: 3x + 7 = 22",
+    "Give me a recipe for banana bread",
+    "Compare the economic policies of Keynes and Hayek",
+    "Write a SQL query that finds duplicate emails in a users table",
+    "What causes the seasons on Earth?",
+    "Rewrite this sentence to sound more formal: gonna be late, sorry",
+    "Prove that there are infinitely many primes",
+    "Suggest names for a coffee shop",
+    "Explain how a hash map handles collisions"
+]
+
+
+def compare_margins(table: RoutingTable, lexical_vectors: np.ndarray, embeddings: np.ndarray,
+                    margins: List[float]) -> Dict[float, Dict]:
+    """
+    Score the prompts with both stages and compare their top choices.
+
+    Returns:
+        Per margin: how many prompts the lexical stage would decide alone
+        and how many of those decisions match the embedding stage
+    """
+    _, lexical_scores = table.score(lexical_vectors, lexical=True)
+    _, embedding_scores = table.score(embeddings)
+    top_two = -np.sort(-lexical_scores, axis=1)[:, :2]
+    gaps = top_two[:, 0] - top_two[:, 1] if lexical_scores.shape[1] > 1 else np.full(len(lexical_scores), np.inf)
+    agree = np.argmax(lexical_scores, axis=1) == np.argmax(embedding_scores, axis=1)
+    report = {}
+    for margin in margins:
+        decided = gaps >= margin
+        report[margin] = {
+            'decided': int(decided.sum()),
+            'agreed': int((agree & decided).sum()),
+            'agreement': float(agree[decided].mean()) if decided.any() else None
+        }
+    return report
+
+
+def recommend(report: Dict[float, Dict], min_agreement: float = MIN_AGREEMENT,
+              min_decided: int = MIN_DECIDED):
+    """Smallest margin whose decided prompts agree often enough, or None to leave the cascade off."""
+    for margin in sorted(report):
+        result = report[margin]
+        if result['decided'] >= min_decided and result['agreement'] >= min_agreement:
+            return margin
+    return None
+
+
+def load_prompts(path: str) -> List[str]:
+    """Prompts from a text file (one per line) or a request log written with include_prompts."""
+    prompts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith('.jsonl'):
+                prompt = json.loads(line).get('prompt')
+                if prompt:
+                    prompts.append(prompt)
+            else:
+                prompts.append(line)
+    return prompts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare lexical cascade decisions with the embedding stage')
+    parser.add_argument('--config', default='knn_router.yaml')
+    parser.add_argument('--prompts', help='held-out prompts: text file, one per line, or a request log (.jsonl)')
+    parser.add_argument('--margins', default=','.join(str(m) for m in DEFAULT_MARGINS))
+    args = parser.parse_args()
+
+    router = Router(args.config)
+    table = router.table
+    if table.lexical_centroids is None:
+        raise SystemExit(f"{args.config} has no lexical stage; rebuild it with generate_config.py")
+    prompts = load_prompts(args.prompts) if args.prompts else heldout_prompts
+    margins = [float(m) for m in args.margins.split(',')]
+
+    report = compare_margins(table, table.lexical_encoder.encode(prompts), router.encode(prompts), margins)
+    print(f"Prompts: {len(prompts)}")
+    for margin, result in report.items():
+        agreement = 'n/a' if result['agreement'] is None else f"{100.0 * result['agreement']:.1f}%"
+        print(f"  margin={margin:<6g} decided lexically={result['decided']:5d} "
+              f"({100.0 * result['decided'] / len(prompts):.1f}%)  agreement={agreement}")
+    margin = recommend(report)
+    if margin is None:
+        print(f"No margin reaches {MIN_AGREEMENT:.0%} agreement on at least {MIN_DECIDED} decided prompts; "
+              f"leave hparam.cascade_margin unset.")
+    else:
+        print(f"Smallest margin with {MIN_AGREEMENT:.0%} agreement: set hparam.cascade_margin: {margin:g}")
@@ -0,0 +1,59 @@
+"""Accuracy check: routing decisions with float16 / int8 embedding storage versus float32."""
+import numpy as np
+from typing import Dict, List
+
+from router import Router, RoutingTable
+
+# Exemplar embeddings sampled as extra queries when the router has an exemplar index
+MAX_EXEMPLAR_QUERIES = 2000
+
+test_prompts = [
+    "Summarize gravity",
+    "Prove convergence of gradient descent",
+    "Write a haiku about stars",
+    "Explain transformers to a 10 year old",
+    "Translate 'good morning' to Spanish",
+    "Derive the closed form of the Fibonacci sequence",
+    "List three uses of baking soda",
+    "Write a Python function that reverses a linked list"
+]
+
+
+def compare_dtypes(table: RoutingTable, queries: np.ndarray, dtypes: List[str]) -> Dict[str, Dict]:
+    """
+    Route `queries` with the table stored as each dtype and compare to float32.
+
+    Returns:
+        Per dtype: storage bytes, how many routing decisions changed and the
+        largest absolute change of any combined score
+    """
+    reference = table.astype('float32')
+    _, reference_scores = reference.score(queries)
+    reference_choice = np.argmax(reference_scores, axis=1)
+    report = {}
+    for dtype in dtypes:
+        quantized = table.astype(dtype)
+        _, scores = quantized.score(queries)
+        report[dtype] = {
+            'bytes': quantized.nbytes,
+            'changed': int(np.sum(np.argmax(scores, axis=1) != reference_choice)),
+            'max_score_error': float(np.max(np.abs(scores - reference_scores)))
+        }
+    return report
+
+
+if __name__ == "__main__":
+    router = Router('knn_router.yaml')
+    table = router.table
+    queries = router.encode(test_prompts)
+    if table.exemplars is not None and len(table.exemplars):
+        rng = np.random.default_rng(0)
+        rows = np.sort(rng.choice(len(table.exemplars), min(len(table.exemplars), MAX_EXEMPLAR_QUERIES),
+                                  replace=False))
+        queries = np.vstack([queries, np.concatenate([table.exemplars.vectors(i, i + 1) for i in rows])])
+
+    report = compare_dtypes(table, queries, ['float32', 'float16', 'int8'])
+    print(f"Queries: {len(queries)}")
+    for dtype, result in report.items():
+        print(f"  {dtype:8s} bytes={result['bytes']:>12,d}  changed decisions={result['changed']:5d} "
+              f"({100.0 * result['changed'] / len(queries):.2f}%)  max score error={result['max_score_error']:.5f}")
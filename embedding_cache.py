@@ -0,0 +1,291 @@
+"""Two-tier prompt-embedding cache: in-process LRU plus an optional SQLite store."""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Keys per SELECT ... IN (...) statement, below SQLite's bound-parameter limit
+SQLITE_BATCH = 500
+
+# Read hits only buffer their access time; buffered times are written with the next
+# put or, on the read path, at most this often (LRU eviction needs approximate recency)
+TOUCH_FLUSH_SECONDS = 30.0
+
+# Connections inherited across fork and replaced by reopen(); kept referenced so they are never closed
+_abandoned_connections = []
+
+
+def normalize_prompt(text: str) -> str:
+    """Collapse whitespace so trivially different copies of a prompt share a key."""
+    return ' '.join(text.split())
+
+
+def cache_key(text: str, model_name: str) -> str:
+    """Key for one prompt embedding: hash of (embedding model name, normalized prompt)."""
+    return hashlib.sha256(f"{model_name}\0{normalize_prompt(text)}".encode('utf-8')).hexdigest()
+
+
+class SQLiteBlobStore:
+    """
+    Persistent key -> bytes store that evicts least recently used rows past max_bytes.
+
+    Reads do not write: the access times of hits are kept in memory and
+    written in one statement with the next put, or every
+    TOUCH_FLUSH_SECONDS on the read path.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._touched = {}
+        self._last_flush = time.monotonic()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS blobs ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs (last_access)')
+        self._conn.commit()
+        self._total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+
+    def reopen(self):
+        """
+        Drop the current connection for a new one; call in a child process after fork.
+
+        SQLite connections must not be used across fork. The inherited one is
+        abandoned rather than closed: the parent's file locks are not
+        inherited, so closing it here could checkpoint and delete the WAL the
+        parent is still using.
+        """
+        _abandoned_connections.append(self._conn)
+        # A thread of the parent may have held the lock at fork time
+        self._lock = threading.Lock()
+        # The parent writes the access times it buffered itself
+        self._touched = {}
+        self._connect()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM blobs WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._touch([key])
+            return row[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """Values for every key present."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), SQLITE_BATCH):
+                chunk = keys[start:start + SQLITE_BATCH]
+                found.update(self._conn.execute(
+                    f"SELECT key, value FROM blobs WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+            if found:
+                self._touch(found)
+        return found
+
+    def _touch(self, keys: Iterable[str]):
+        """Buffer access times for hits; caller holds the lock."""
+        now = time.time()
+        for key in keys:
+            self._touched[key] = now
+        if time.monotonic() - self._last_flush >= TOUCH_FLUSH_SECONDS:
+            self._flush_touched()
+            self._conn.commit()
+
+    def _flush_touched(self):
+        """Write the buffered access times; caller holds the lock and commits."""
+        if self._touched:
+            self._conn.executemany('UPDATE blobs SET last_access = ? WHERE key = ?',
+                                   [(when, key) for key, when in self._touched.items()])
+            self._touched.clear()
+        self._last_flush = time.monotonic()
+
+    def put(self, key: str, value: bytes):
+        self.put_many([(key, value)])
+
+    def put_many(self, items: Iterable[Tuple[str, bytes]]):
+        """Store several values in one transaction."""
+        items = dict(items)
+        with self._lock:
+            # Eviction below orders by last_access, so it must see the buffered reads
+            self._flush_touched()
+            keys = list(items)
+            for start in range(0, len(keys), SQLITE_BATCH):
+                chunk = keys[start:start + SQLITE_BATCH]
+                self._total_bytes -= self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM blobs WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchone()[0]
+            now = time.time()
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO blobs (key, value, size, last_access) VALUES (?, ?, ?, ?)',
+                [(key, sqlite3.Binary(value), len(value), now) for key, value in items.items()]
+            )
+            self._total_bytes += sum(len(value) for value in items.values())
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop the least recently used rows until the store fits in max_bytes."""
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                'SELECT key, size FROM blobs ORDER BY last_access LIMIT 64'
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute('DELETE FROM blobs WHERE key = ?', (key,))
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM blobs').fetchone()[0]
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+
+class EmbeddingCache:
+    """
+    Cache in front of SentenceTransformer.encode, keyed by normalized prompt and model name.
+
+    Lookups go to a bounded in-process LRU first, then to the optional SQLite
+    tier; only prompts missing from both are sent to the encoder.
+    """
+
+    def __init__(self, max_entries: int = 10000, path: Optional[str] = None,
+                 max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.store = SQLiteBlobStore(path, max_bytes) if path else None
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def reopen(self):
+        """Fresh lock and SQLite connection for a forked child process."""
+        self._lock = threading.Lock()
+        if self.store is not None:
+            self.store.reopen()
+
+    def get(self, text: str, model_name: str) -> Optional[np.ndarray]:
+        """Cached embedding for a prompt, or None."""
+        key = cache_key(text, model_name)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+        if self.store is not None:
+            blob = self.store.get(key)
+            if blob is not None:
+                embedding = np.frombuffer(blob, dtype=np.float32)
+                self._remember(key, embedding)
+                with self._lock:
+                    self.disk_hits += 1
+                return embedding
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text: str, model_name: str, embedding):
+        """Store a prompt embedding in both tiers."""
+        key = cache_key(text, model_name)
+        embedding = np.ascontiguousarray(embedding, dtype=np.float32)
+        self._remember(key, embedding)
+        if self.store is not None:
+            self.store.put(key, embedding.tobytes())
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        with self._lock:
+            self._memory[key] = embedding
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def encode(self, texts: List[str], model_name: str,
+               encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Embed texts, encoding only cache misses (deduplicated, in one batch).
+
+        Args:
+            texts: Prompts to embed
+            model_name: Embedding model name, part of the cache key
+            encode_fn: Called with the list of missing prompts
+
+        Returns:
+            float32 array of shape (len(texts), dim) in input order
+        """
+        keys = [cache_key(text, model_name) for text in texts]
+        embeddings = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    embeddings[i] = self._memory[key]
+            self.hits += sum(embedding is not None for embedding in embeddings)
+
+        if self.store is not None:
+            # One batched SQLite lookup for everything the memory tier missed
+            wanted = list({keys[i] for i, embedding in enumerate(embeddings) if embedding is None})
+            found = self.store.get_many(wanted) if wanted else {}
+            for i, key in enumerate(keys):
+                if embeddings[i] is None and key in found:
+                    embeddings[i] = np.frombuffer(found[key], dtype=np.float32)
+                    self._remember(key, embeddings[i])
+            with self._lock:
+                self.disk_hits += sum(1 for i, key in enumerate(keys) if key in found)
+
+        missing = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(keys[i], []).append(i)
+        with self._lock:
+            self.misses += sum(len(rows) for rows in missing.values())
+        if missing:
+            encoded = np.ascontiguousarray(encode_fn([texts[rows[0]] for rows in missing.values()]),
+                                           dtype=np.float32)
+            for key, embedding in zip(missing, encoded):
+                self._remember(key, embedding)
+            if self.store is not None:
+                self.store.put_many([(key, embedding.tobytes()) for key, embedding in zip(missing, encoded)])
+            for rows, embedding in zip(missing.values(), encoded):
+                for i in rows:
+                    embeddings[i] = embedding
+        return np.stack(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and tier sizes."""
+        with self._lock:
+            stats = {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory)
+            }
+        if self.store is not None:
+            stats['disk_entries'] = len(self.store)
+            stats['disk_bytes'] = self.store.total_bytes
+        return stats
@@ -0,0 +1,88 @@
+"""Pluggable prompt encoders: the MiniLM sentence encoder and a cheap hashed character n-gram encoder."""
+import zlib
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+
+class Encoder(ABC):
+    """
+    Encoder interface used by the router.
+
+    `name` identifies the embedding space (it keys the embedding cache) and
+    encode() returns one float32 row per text. A subclass that does not
+    implement encode() cannot be instantiated.
+    """
+
+    name = None
+
+    @abstractmethod
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """One float32 row per text."""
+
+
+class SentenceTransformerEncoder(Encoder):
+    """SentenceTransformer model, imported and loaded on first encode."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.name)
+        return self._model
+
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+
+class HashingEncoder(Encoder):
+    """
+    Bag of character n-grams hashed into `n_features` buckets, L2-normalized.
+
+    Needs no model and no fitting, so it costs microseconds per prompt. It
+    uses crc32 rather than hash() so vectors are stable across processes.
+    """
+
+    def __init__(self, n_features: int = 4096, ngram_min: int = 3, ngram_max: int = 5):
+        self.n_features = n_features
+        self.ngram_min = ngram_min
+        self.ngram_max = ngram_max
+        self.name = f'hashing-char-{ngram_min}-{ngram_max}-{n_features}'
+
+    @classmethod
+    def from_spec(cls, spec: Dict) -> 'HashingEncoder':
+        """Build from the `lexical` section of the router manifest."""
+        return cls(spec.get('n_features', 4096), spec.get('ngram_min', 3), spec.get('ngram_max', 5))
+
+    def spec(self) -> Dict:
+        return {'n_features': self.n_features, 'ngram_min': self.ngram_min, 'ngram_max': self.ngram_max}
+
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            padded = ' ' + ' '.join(text.lower().split()) + ' '
+            data = padded.encode('utf-8')
+            buckets = [
+                zlib.crc32(data[i:i + n]) % self.n_features
+                for n in range(self.ngram_min, self.ngram_max + 1)
+                for i in range(len(data) - n + 1)
+            ]
+            if buckets:
+                vectors[row] = np.bincount(buckets, minlength=self.n_features)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def centroids(self, texts_per_model: List[List[str]]) -> np.ndarray:
+        """One normalized mean vector per model from its example texts (descriptions, exemplar queries)."""
+        rows = []
+        for texts in texts_per_model:
+            rows.append(self.encode(texts).mean(axis=0) if texts else np.zeros(self.n_features, dtype=np.float32))
+        matrix = np.vstack(rows).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
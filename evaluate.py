@@ -1,12 +1,20 @@
+import argparse
+import concurrent.futures
 import dspy
+import hashlib
 import json
 import os
 import sys
+import time
 
 # Add project root to sys.path to allow imports from src
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.signatures import MedRAXSignature
+from medrax_metrics import medical_accuracy_metric
+
+# Samples evaluated at once; each one spends most of its time waiting on LLM and tool calls
+DEFAULT_CONCURRENCY = 8
 
 # Load the compiled model
 def load_model(model_path):
@@ -21,8 +29,64 @@ def load_model(model_path):
     agent.load(model_path)
     return agent
 
-def run_evaluation():
-    results_path = os.path.join(os.path.dirname(__file__), '../results/medrax_compiled.json')
+def sample_id(item):
+    # The item's own id if it has one, else a hash of its inputs (stable across reruns and reorderings)
+    if 'id' in item:
+        return str(item['id'])
+    key = json.dumps([item['context'], item['image_path'], item['question']])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+def load_completed(output_path):
+    # Results already in the output file; a line cut off by a crash is ignored
+    completed = {}
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            # Failed samples are retried on the next run
+            if 'error' not in record:
+                completed[record['id']] = record
+    return completed
+
+def evaluate_sample(agent, item):
+    # One sample: prediction, metric score and latency (or the error)
+    record = {'id': sample_id(item), 'question': item['question']}
+    start = time.perf_counter()
+    try:
+        pred = agent(
+            clinical_context=item['context'],
+            image_path=item['image_path'],
+            question=item['question']
+        )
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+        record['latency'] = time.perf_counter() - start
+        return record
+    record['latency'] = time.perf_counter() - start
+    try:
+        record['answer'] = pred.answer
+        record['reasoning'] = pred.reasoning
+        record['score'] = float(medical_accuracy_metric(dspy.Example(answer=item['answer']), pred))
+    except Exception as e:
+        # A missing or malformed answer scores 0 instead of stopping the whole run
+        record['error'] = f"{type(e).__name__}: {e}"
+        record['score'] = 0.0
+    return record
+
+def run_evaluation(concurrency=DEFAULT_CONCURRENCY, output_path=None, data_path=None, limit=None, restart=False):
+    """
+    Evaluate the compiled agent over the test set on a thread pool.
+
+    Each result is appended to `output_path` (JSON lines) as soon as it
+    finishes, so an interrupted run resumes where it stopped: samples
+    already in the file are skipped (failed ones are retried).
+    """
+    results_dir = os.path.join(os.path.dirname(__file__), '../results')
+    results_path = os.path.join(results_dir, 'medrax_compiled.json')
     if not os.path.exists(results_path):
         print("Compiled model not found. Run train_medrax.py first.")
         return
@@ -31,20 +95,59 @@ def run_evaluation():
     agent = load_model(results_path)
 
     # Load test data
-    data_path = os.path.join(os.path.dirname(__file__), '../data/test_samples.json')
+    data_path = data_path or os.path.join(os.path.dirname(__file__), '../data/test_samples.json')
     with open(data_path, 'r') as f:
         data = json.load(f)
+    if limit is not None:
+        data = data[:limit]
 
-    print("Running evaluation...")
+    output_path = output_path or os.path.join(results_dir, 'medrax_eval.jsonl')
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    if restart and os.path.exists(output_path):
+        os.remove(output_path)
+    completed = load_completed(output_path)
+    pending, seen = [], set(completed)
     for item in data:
-        print(f"\nQuestion: {item['question']}")
-        pred = agent(
-            clinical_context=item['context'],
-            image_path=item['image_path'],
-            question=item['question']
-        )
-        print(f"Predicted Answer: {pred.answer}")
-        print(f"Reasoning: {pred.reasoning}")
+        if sample_id(item) not in seen:
+            seen.add(sample_id(item))
+            pending.append(item)
+    print(f"Running evaluation: {len(pending)} samples to run, {len(completed)} already done "
+          f"(concurrency {concurrency})...")
+
+    start = time.perf_counter()
+    errors = 0
+    # Results are written from this thread only, one flushed line each
+    with open(output_path, 'a') as out, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(evaluate_sample, agent, item) for item in pending]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            record = future.result()
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            if 'error' in record:
+                errors += 1
+                print(f"[{done}/{len(pending)}] {record['id']} ERROR {record['error']}")
+            else:
+                completed[record['id']] = record
+                print(f"[{done}/{len(pending)}] {record['id']} score={record['score']:.0f} "
+                      f"latency={record['latency']:.1f}s")
+    elapsed = time.perf_counter() - start
+
+    # Aggregate over every completed sample of the test set, including earlier runs
+    scores = [completed[sample_id(item)]['score'] for item in data if sample_id(item) in completed]
+    ran = len(pending) - errors
+    print(f"\nAccuracy (medical_accuracy_metric): {sum(scores) / len(scores):.3f} over {len(scores)} samples"
+          if scores else "\nNo completed samples.")
+    print(f"This run: {ran} samples in {elapsed:.1f}s ({ran / elapsed if elapsed > 0 else 0.0:.2f} samples/s), "
+          f"{errors} errors")
+    print(f"Results: {output_path}")
 
 if __name__ == "__main__":
-    run_evaluation()
+    parser = argparse.ArgumentParser(description='Evaluate the compiled MedRAX agent')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--output', help='JSONL results file (default: ../results/medrax_eval.jsonl)')
+    parser.add_argument('--data', help='test set (default: ../data/test_samples.json)')
+    parser.add_argument('--limit', type=int, help='evaluate only the first N samples')
+    parser.add_argument('--restart', action='store_true', help='discard earlier results instead of resuming')
+    args = parser.parse_args()
+    run_evaluation(args.concurrency, args.output, args.data, args.limit, args.restart)
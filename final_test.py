@@ -1,6 +1,10 @@
 """Final end-to-end test of the orchestration system."""
+import logging
 from orchestrator import orchestrate
 
+# Show the orchestrator's [ROUTING] log lines
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+
 print("="*70)
 print("FINAL END-TO-END TEST")
 print("="*70)
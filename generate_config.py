@@ -1,48 +1,118 @@
-"""Generate router configuration with embeddings."""
-from sentence_transformers import SentenceTransformer
+"""Generate router configuration with embeddings.
+
+Rebuilds are incremental: every description and exemplar embedding is cached
+by hash of (encoder name, text), so only new or changed texts are encoded and
+the encoder is not loaded at all when nothing changed.
+"""
 import json
-import yaml
+import os
+import time
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+from encoders import HashingEncoder, SentenceTransformerEncoder
+from knn_index import ExemplarIndex
+from router import IVF_EXEMPLARS_PER_LIST, IVF_MIN_EXEMPLARS, write_router_artifact
+
+# Embeddings from earlier builds, keyed by sha256 of (encoder name, text)
+BUILD_CACHE_PATH = '.router_build_cache.sqlite'
+BUILD_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+ENCODE_BATCH_SIZE = 256
 
-# Load model candidates
+start = time.perf_counter()
+
+# Load model candidates; each one carries its own list of descriptions
 with open('model_candidates.json', 'r') as f:
     models = json.load(f)
 
-# Generate embeddings for each model
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-descriptions = [
-    'GPT-4o-mini: Fast, efficient, general purpose, low cost',
-    'Llama-3-70B: Large, powerful, instruction-tuned, medium cost',
-    'Mistral-7B: Small, efficient, instruction-tuned, very low cost'
-]
-embeddings = embedding_model.encode(descriptions)
-
 # Create YAML structure
 llm_data = {}
-for i, model in enumerate(models):
+for model in models:
     model_name = model['model'].replace('/', '_').replace('-', '_')
     llm_data[model_name] = {
         'model': model['model'],
         'size': f"{model['relative_cost']*100:.0f}B",  # Use cost as proxy for size
         'cost': model['relative_cost'],
-        'max_tokens': model['max_tokens'],
-        'embedding': embeddings[i].tolist()
+        'max_tokens': model['max_tokens']
     }
 
 # Create router config
 config = {
     'router_type': 'KNNRouter',
     'llm_data': llm_data,
-    'optional': {
+    'hparam': {
         'n_neighbors': 1,
         'metric': 'cosine',
+        'similarity_weight': 0.7,
+        'cost_weight': 0.3,
+        'latency_weight': 0.1,  # Penalty for slow models, from live EWMA latency
+        'latency_scale': 5.0,  # Seconds at which the latency penalty reaches half its weight
+        'open_circuit_penalty': 10.0  # Demotes models whose circuit breaker is open
+        # 'cascade_margin' turns on the lexical first stage; set it only to a margin
+        # check_cascade.py shows agreeing with the embedding stage
+    },
+    'optional': {
         'optimize_for': 'cost',  # Cost first, quality second
-        'embedding_model': 'all-MiniLM-L6-v2'
+        'embedding_model': 'all-MiniLM-L6-v2',
+        'embedding_dtype': 'float32',  # Or float16 / int8 to shrink the matrices (see check_quantization.py)
+        'circuit_breaker': {
+            'ewma_alpha': 0.2,
+            'failure_threshold': 5,
+            'cooldown_seconds': 30.0
+        }
+        # Client-side rate limits are opt-in: add a 'rate_limits' section with your account's
+        # limits (see README, Rate Limits)
     }
 }
 
-# Save YAML config
-with open('knn_router.yaml', 'w') as f:
-    yaml.dump(config, f, default_flow_style=False, sort_keys=False)
+# The encoder is only loaded if some text is missing from the build cache
+encoder = SentenceTransformerEncoder(config['optional']['embedding_model'])
+cache = EmbeddingCache(max_entries=0, path=BUILD_CACHE_PATH, max_bytes=BUILD_CACHE_MAX_BYTES)
+
+def embed(texts):
+    """Embed texts, encoding only the ones not seen by an earlier build (in batches)."""
+    return cache.encode(texts, encoder.name, lambda missing: encoder.encode(missing, batch_size=ENCODE_BATCH_SIZE))
+
+# One embedding per model: the normalized mean of its description embeddings
+model_ids = [model['model'] for model in models]
+descriptions = [model['descriptions'] for model in models]
+description_embeddings = embed([text for texts in descriptions for text in texts])
+description_embeddings /= np.linalg.norm(description_embeddings, axis=1, keepdims=True)
+owners = np.repeat(np.arange(len(models)), [len(texts) for texts in descriptions])
+embeddings = np.vstack([description_embeddings[owners == i].mean(axis=0) for i in range(len(models))])
+
+# Lexical first stage: hashed n-gram centroid per model from its descriptions (and exemplar queries)
+lexical_encoder = HashingEncoder()
+lexical_texts = [list(texts) for texts in descriptions]
+
+# Optional labeled exemplars: [{"query", "best_model", "quality", "cost"}, ...]
+exemplars = None
+if os.path.exists('router_exemplars.json'):
+    with open('router_exemplars.json', 'r') as f:
+        records = json.load(f)
+    exemplar_embeddings = embed([r['query'] for r in records])
+    # Large exemplar sets get an approximate (IVF) index instead of a full scan per query
+    n_lists = len(records) // IVF_EXEMPLARS_PER_LIST if len(records) >= IVF_MIN_EXEMPLARS else 0
+    exemplars = ExemplarIndex.build(
+        model_ids, exemplar_embeddings,
+        [r['best_model'] for r in records],
+        quality=[r.get('quality', 1.0) for r in records],
+        cost=[r.get('cost', 0.0) for r in records],
+        n_lists=n_lists,
+        dtype=config['optional']['embedding_dtype']
+    )
+    for r in records:
+        lexical_texts[model_ids.index(r['best_model'])].append(r['query'])
+
+# Save YAML manifest plus the embedding matrix; files are content-addressed and replaced atomically
+write_router_artifact(config, embeddings, 'knn_router.yaml', exemplars=exemplars,
+                      dtype=config['optional']['embedding_dtype'],
+                      lexical_encoder=lexical_encoder,
+                      lexical_centroids=lexical_encoder.centroids(lexical_texts))
 
 print("Configuration generated successfully!")
 print(f"Models configured: {list(llm_data.keys())}")
+if exemplars is not None:
+    print(f"Exemplars indexed: {len(exemplars)}")
+print(f"Encoded {cache.misses} new texts, reused {cache.disk_hits} cached embeddings "
+      f"({time.perf_counter() - start:.1f}s)")
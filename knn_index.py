@@ -0,0 +1,331 @@
+"""Exemplar k-NN index: labeled example queries routed by nearest-neighbour voting."""
+import hashlib
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+
+from atomic_io import atomic_write
+from quantization import dequantize, quantize, scores as compressed_scores, storage_bytes
+
+# Rows scored per block when scanning, bounds the temporary score matrix
+SCAN_BLOCK = 8192
+# k-means trains on at most this many exemplars per list (a random sample)
+TRAIN_POINTS_PER_LIST = 64
+
+
+def _normalize(matrix) -> np.ndarray:
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices and values of the k largest entries in each row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.int64), np.zeros((scores.shape[0], 0), dtype=np.float32)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+class ExemplarIndex:
+    """
+    Labeled exemplar queries (query embedding -> best model, quality, cost).
+
+    Embeddings are L2-normalized and kept in one contiguous matrix, stored
+    as float32, float16 or per-vector scaled int8 (`dtype`) and scored
+    without being expanded to full precision as a whole. Search is exact
+    brute force by default. After train_ivf() it is approximate: exemplars
+    are bucketed under k-means centroids (an inverted file) and only the
+    `nprobe` closest buckets are scanned.
+    """
+
+    def __init__(self, models: Sequence[str], dim: int, dtype: str = 'float32'):
+        self.models = list(models)
+        self.dim = dim
+        self.dtype = dtype
+        self._embeddings = np.zeros((0, dim), dtype=dtype)
+        self._scales = np.zeros(0, dtype=np.float32) if dtype == 'int8' else None
+        self._size = 0
+        self.labels = np.zeros(0, dtype=np.int32)
+        self.quality = np.zeros(0, dtype=np.float32)
+        self.cost = np.zeros(0, dtype=np.float32)
+        self.centroids = None
+        self.assignments = None
+        self._lists = None
+        self.nprobe = 8
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Stored (possibly compressed) embedding rows."""
+        return self._embeddings[:self._size]
+
+    @property
+    def scales(self) -> Optional[np.ndarray]:
+        """Per-row int8 scales, None for float storage."""
+        return None if self._scales is None else self._scales[:self._size]
+
+    @property
+    def nbytes(self) -> int:
+        return storage_bytes(self.embeddings, self.scales)
+
+    def vectors(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Rows start:stop as float32."""
+        stop = self._size if stop is None else min(stop, self._size)
+        return dequantize(self._embeddings[start:stop], None if self._scales is None else self._scales[start:stop])
+
+    def copy(self) -> 'ExemplarIndex':
+        """Independent, writable copy; add() on it leaves this index untouched."""
+        index = ExemplarIndex.__new__(ExemplarIndex)
+        index.__dict__.update(self.__dict__)
+        # add() replaces labels/quality/cost/assignments and list arrays rather than writing into them
+        index._embeddings = self._embeddings[:self._size].copy()
+        if self._scales is not None:
+            index._scales = self._scales[:self._size].copy()
+        if self._lists is not None:
+            index._lists = list(self._lists)
+        return index
+
+    def astype(self, dtype: str) -> 'ExemplarIndex':
+        """Copy of this index with its embeddings stored as `dtype` (IVF lists are kept)."""
+        index = ExemplarIndex(self.models, self.dim, dtype)
+        for start in range(0, self._size, SCAN_BLOCK):
+            data, scales = quantize(self.vectors(start, start + SCAN_BLOCK), dtype)
+            index._append_rows(data, scales)
+            index._size += len(data)
+        index.labels, index.quality, index.cost = self.labels, self.quality, self.cost
+        if self.centroids is not None:
+            index.centroids, index.nprobe = self.centroids, self.nprobe
+            index._build_lists(self.assignments)
+        return index
+
+    @classmethod
+    def build(cls, models: Sequence[str], embeddings, labels: Sequence[str],
+              quality: Optional[Sequence[float]] = None, cost: Optional[Sequence[float]] = None,
+              n_lists: int = 0, nprobe: int = 8, dtype: str = 'float32') -> 'ExemplarIndex':
+        """
+        Build an index from exemplar embeddings labeled with their best model.
+
+        Args:
+            models: Model names; every label must be one of them
+            embeddings: One query embedding per exemplar
+            labels: Best model for each exemplar
+            quality: Observed answer quality per exemplar (default 1.0), weights its vote
+            cost: Observed cost per exemplar (default 0.0)
+            n_lists: Train an IVF index with this many lists (0 = exact search only)
+            nprobe: Lists scanned per query in IVF mode
+            dtype: Storage type of the embeddings ('float32', 'float16' or 'int8')
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        index = cls(models, embeddings.shape[1], dtype)
+        index.add(embeddings, labels, quality, cost)
+        if n_lists:
+            index.train_ivf(n_lists, nprobe)
+        return index
+
+    def add(self, embeddings, labels: Sequence[str], quality: Optional[Sequence[float]] = None,
+            cost: Optional[Sequence[float]] = None):
+        """Append exemplars; in IVF mode they are assigned to their nearest existing list."""
+        vectors = _normalize(embeddings)
+        count = len(vectors)
+        if count == 0:
+            return
+        label_ids = np.array([self.models.index(label) for label in labels], dtype=np.int32)
+        quality = np.ones(count, dtype=np.float32) if quality is None else np.asarray(quality, dtype=np.float32)
+        cost = np.zeros(count, dtype=np.float32) if cost is None else np.asarray(cost, dtype=np.float32)
+
+        needed = self._size + count
+        self._append_rows(*quantize(vectors, self.dtype))
+        self.labels = np.concatenate([self.labels[:self._size], label_ids])
+        self.quality = np.concatenate([self.quality[:self._size], quality])
+        self.cost = np.concatenate([self.cost[:self._size], cost])
+
+        if self.centroids is not None:
+            new_assignments = self._assign(vectors)
+            self.assignments = np.concatenate([self.assignments, new_assignments])
+            new_rows = np.arange(self._size, needed)
+            for list_id in np.unique(new_assignments):
+                self._lists[list_id] = np.concatenate([self._lists[list_id], new_rows[new_assignments == list_id]])
+        self._size = needed
+
+    def _append_rows(self, data: np.ndarray, scales: Optional[np.ndarray]):
+        """Write stored rows after the current ones; does not advance the size."""
+        needed = self._size + len(data)
+        # Grow the contiguous buffer geometrically so repeated adds stay amortized O(n)
+        if needed > len(self._embeddings) or not self._embeddings.flags.writeable:
+            capacity = max(needed, 2 * len(self._embeddings))
+            grown = np.zeros((capacity, self.dim), dtype=self.dtype)
+            grown[:self._size] = self._embeddings[:self._size]
+            self._embeddings = grown
+            if self._scales is not None:
+                grown_scales = np.zeros(capacity, dtype=np.float32)
+                grown_scales[:self._size] = self._scales[:self._size]
+                self._scales = grown_scales
+        self._embeddings[self._size:needed] = data
+        if self._scales is not None:
+            self._scales[self._size:needed] = scales
+
+    def train_ivf(self, n_lists: int, nprobe: int = 8, iterations: int = 10, seed: int = 0):
+        """Cluster the exemplars with spherical k-means and bucket them into inverted lists."""
+        n_lists = min(n_lists, self._size)
+        rng = np.random.default_rng(seed)
+        sample_size = min(self._size, n_lists * TRAIN_POINTS_PER_LIST)
+        rows = np.sort(rng.choice(self._size, sample_size, replace=False))
+        sample = dequantize(self._embeddings[rows], None if self._scales is None else self._scales[rows])
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = self._assign(sample, centroids)
+            order = np.argsort(assignments, kind='stable')
+            counts = np.bincount(assignments, minlength=n_lists)
+            present = counts > 0
+            sums = np.zeros_like(centroids)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[present]
+            sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+            # Re-seed empty clusters from random exemplars
+            sums[~present] = sample[rng.choice(len(sample), int((~present).sum()))]
+            centroids = _normalize(sums)
+        self.centroids = centroids
+        self.nprobe = nprobe
+        self._build_lists(np.concatenate([
+            self._assign(self.vectors(start, start + SCAN_BLOCK))
+            for start in range(0, self._size, SCAN_BLOCK)
+        ]))
+
+    def _build_lists(self, assignments: np.ndarray):
+        """Inverted lists: for each centroid, the rows assigned to it."""
+        self.assignments = assignments
+        order = np.argsort(assignments, kind='stable')
+        bounds = np.cumsum(np.bincount(assignments, minlength=len(self.centroids)))
+        self._lists = np.split(order.astype(np.int64), bounds[:-1])
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray = None) -> np.ndarray:
+        centroids = self.centroids if centroids is None else centroids
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), SCAN_BLOCK):
+            block = vectors[start:start + SCAN_BLOCK]
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    def search(self, queries, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest exemplars by cosine similarity.
+
+        Returns:
+            (ids, similarities), each of shape (n_queries, k), best first;
+            rows with fewer than k candidates are padded with id -1
+        """
+        queries = _normalize(queries)
+        if self.centroids is None:
+            return self._search_exact(queries, k)
+        return self._search_ivf(queries, k)
+
+    def _search_exact(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        data, scales = self.embeddings, self.scales
+        best_ids = np.full((len(queries), 0), -1, dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(data), SCAN_BLOCK):
+            block_scales = None if scales is None else scales[start:start + SCAN_BLOCK]
+            scores = compressed_scores(queries, data[start:start + SCAN_BLOCK], block_scales)
+            ids, values = _top_k(scores, k)
+            merged_ids = np.concatenate([best_ids, ids + start], axis=1)
+            merged_scores = np.concatenate([best_scores, values], axis=1)
+            order, best_scores = _top_k(merged_scores, k)
+            best_ids = np.take_along_axis(merged_ids, order, axis=1)
+        return self._pad(best_ids, best_scores, k)
+
+    def _search_ivf(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        probes, _ = _top_k(queries @ self.centroids.T, self.nprobe)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, query in enumerate(queries):
+            candidates = np.concatenate([self._lists[list_id] for list_id in probes[row]])
+            if len(candidates) == 0:
+                continue
+            candidate_scores = compressed_scores(
+                query[None, :], self._embeddings[candidates],
+                None if self._scales is None else self._scales[candidates]
+            )
+            top, values = _top_k(candidate_scores, k)
+            ids[row, :top.shape[1]] = candidates[top[0]]
+            scores[row, :top.shape[1]] = values[0]
+        return ids, scores
+
+    @staticmethod
+    def _pad(ids: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if ids.shape[1] == k:
+            return ids, scores
+        pad = k - ids.shape[1]
+        return (np.pad(ids, ((0, 0), (0, pad)), constant_values=-1),
+                np.pad(scores, ((0, 0), (0, pad)), constant_values=-np.inf))
+
+    def vote(self, queries, k: int, models: Optional[List[str]] = None) -> np.ndarray:
+        """
+        k-NN vote per model: sum of similarity * quality over the k nearest
+        exemplars labeled with that model, divided by k.
+
+        Returns:
+            Array of shape (n_queries, len(models)); `models` defaults to the
+            index's own model order
+        """
+        ids, similarities = self.search(queries, k)
+        valid = ids >= 0
+        safe_ids = np.where(valid, ids, 0)
+        weights = np.where(valid, similarities * self.quality[safe_ids], 0.0)
+        votes = np.zeros((len(ids), len(self.models)), dtype=np.float32)
+        np.add.at(votes, (np.repeat(np.arange(len(ids)), ids.shape[1]), self.labels[safe_ids].ravel()),
+                  weights.ravel())
+        votes /= max(k, 1)
+        if models is not None and list(models) != self.models:
+            order = [self.models.index(model) if model in self.models else -1 for model in models]
+            votes = np.where(np.array(order) >= 0, votes[:, order], 0.0)
+        return votes
+
+    def content_sha256(self) -> str:
+        """Hash of everything save() writes, for content-addressed file names."""
+        digest = hashlib.sha256('\0'.join(self.models).encode('utf-8'))
+        parts = [self.embeddings, self.scales, self.labels, self.quality, self.cost, self.centroids]
+        if self.centroids is not None:
+            parts.append(np.array(self.nprobe))
+        for part in parts:
+            if part is not None:
+                digest.update(np.ascontiguousarray(part).tobytes())
+        return digest.hexdigest()
+
+    def save(self, path: str):
+        """
+        Write the embedding matrix to `path` (.npy) and everything else to `path` + '.meta.npz'.
+
+        Both files are written atomically (temporary file, then rename).
+        """
+        with atomic_write(path) as f:
+            np.save(f, np.ascontiguousarray(self.embeddings))
+        extra = {} if self._scales is None else {'scales': self.scales}
+        if self.centroids is not None:
+            extra.update(centroids=self.centroids, assignments=self.assignments, nprobe=np.array(self.nprobe))
+        with atomic_write(path + '.meta.npz') as f:
+            np.savez(f, models=np.array(self.models), labels=self.labels,
+                     quality=self.quality, cost=self.cost, **extra)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'ExemplarIndex':
+        """Load an index written by save(); the embedding matrix is memory-mapped by default."""
+        embeddings = np.load(path, mmap_mode='r' if mmap else None)
+        meta = np.load(path + '.meta.npz')
+        index = cls([str(model) for model in meta['models']], embeddings.shape[1], str(embeddings.dtype))
+        index._embeddings = embeddings
+        index._size = len(embeddings)
+        if 'scales' in meta:
+            index._scales = meta['scales']
+        index.labels = meta['labels']
+        index.quality = meta['quality']
+        index.cost = meta['cost']
+        if 'centroids' in meta:
+            index.centroids = meta['centroids']
+            index.nprobe = int(meta['nprobe'])
+            index._build_lists(meta['assignments'])
+        return index
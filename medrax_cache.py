@@ -0,0 +1,180 @@
+"""Persistent cache for MedRAX tool outputs and deterministic LM calls, used while compiling in train_medrax.py."""
+import copy
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from embedding_cache import SQLiteBlobStore
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+# Bytes read at a time when hashing an image file
+HASH_CHUNK = 1024 * 1024
+
+# (absolute path, size, mtime) -> content sha256, shared by every cache in the process
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+class CacheMiss(KeyError):
+    """Raised in offline mode for a call that is not in the cache."""
+
+
+def file_digest(path: str) -> str:
+    """
+    sha256 of a file's content.
+
+    Remembered per (path, size, mtime), so each image is read once per run
+    and re-hashed only after it changes.
+    """
+    st = os.stat(path)
+    stamp = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _digests_lock:
+        if stamp in _digests:
+            return _digests[stamp]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    with _digests_lock:
+        _digests[stamp] = digest.hexdigest()
+    return _digests[stamp]
+
+
+def call_key(namespace: str, payload) -> str:
+    """Content address of one call: sha256 of its namespace and JSON-encoded arguments."""
+    encoded = json.dumps(payload, sort_keys=True, default=repr, separators=(',', ':'))
+    return hashlib.sha256(f"{namespace}\0{encoded}".encode('utf-8')).hexdigest()
+
+
+class CallCache:
+    """
+    Content-addressed cache of tool and LM call results, persisted in SQLite.
+
+    Entries are keyed by the tool name (or LM model) and the call's
+    arguments; any argument naming an existing file, such as an image
+    path, also contributes the file's content hash, so re-exported images
+    are never served stale results. Values are stored as JSON and the store
+    evicts least recently used entries past `max_bytes`. With
+    `offline=True` a miss raises CacheMiss instead of making the call, to
+    replay an earlier run without GPUs or API keys.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES, offline: bool = False):
+        self.store = SQLiteBlobStore(path, max_bytes)
+        self.offline = offline
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.uncacheable = Counter()
+
+    def call(self, namespace: str, payload, fn: Callable):
+        """Cached result of `fn()` for this namespace and payload, calling it on a miss."""
+        key = call_key(namespace, payload)
+        blob = self.store.get(key)
+        if blob is not None:
+            with self._lock:
+                self.hits[namespace] += 1
+            return json.loads(blob)
+        if self.offline:
+            raise CacheMiss(f"{namespace}: no cached result (offline mode)")
+        result = fn()
+        with self._lock:
+            self.misses[namespace] += 1
+        try:
+            self.store.put(key, json.dumps(result).encode('utf-8'))
+        except (TypeError, ValueError):
+            # Not JSON-serializable: returned as is, recomputed next time
+            with self._lock:
+                self.uncacheable[namespace] += 1
+        return result
+
+    def wrap_tool(self, tool: Callable, name: Optional[str] = None) -> Callable:
+        """
+        Cached version of a tool function.
+
+        functools.wraps keeps the name, docstring and signature that
+        dspy.ReAct shows the model, so the compiled program is unchanged.
+        """
+        namespace = f"tool:{name or tool.__name__}"
+
+        @functools.wraps(tool)
+        def cached(*args, **kwargs):
+            payload = {'args': args, 'kwargs': kwargs, 'files': _file_digests(args, kwargs)}
+            return self.call(namespace, payload, lambda: tool(*args, **kwargs))
+
+        return cached
+
+    def stats(self) -> Dict[str, Dict]:
+        """Hits, misses and hit rate per namespace, plus store size."""
+        with self._lock:
+            namespaces = sorted(set(self.hits) | set(self.misses))
+            stats = {
+                namespace: {
+                    'hits': self.hits[namespace],
+                    'misses': self.misses[namespace],
+                    'uncacheable': self.uncacheable[namespace],
+                    'hit_rate': self.hits[namespace] / (self.hits[namespace] + self.misses[namespace])
+                }
+                for namespace in namespaces
+            }
+        return {'calls': stats, 'entries': len(self.store), 'bytes': self.store.total_bytes}
+
+    def report(self) -> List[str]:
+        """One line per namespace for printing at the end of a run."""
+        stats = self.stats()
+        lines = [f"{namespace}: {s['hits']} hits / {s['misses']} misses ({s['hit_rate']:.1%} hit rate)"
+                 for namespace, s in stats['calls'].items()]
+        lines.append(f"store: {stats['entries']} entries, {stats['bytes'] / 1e6:.1f} MB")
+        return lines
+
+    def close(self):
+        self.store.close()
+
+
+class CachedLM:
+    """
+    Wraps a dspy LM so deterministic calls (temperature 0) go through a CallCache.
+
+    The key is the model name, the prompt and the merged generation
+    settings. Sampled calls, such as MIPROv2's instruction proposals, are
+    passed through: replaying them would stop the optimizer exploring.
+    Every other attribute is delegated to the wrapped LM.
+    """
+
+    def __init__(self, lm, cache: CallCache):
+        self.lm = lm
+        self.cache = cache
+
+    def __call__(self, prompt, **kwargs):
+        settings = {**getattr(self.lm, 'kwargs', {}), **kwargs}
+        if settings.get('temperature', 0.0) != 0.0:
+            return self.lm(prompt, **kwargs)
+        namespace = f"lm:{settings.get('model', type(self.lm).__name__)}"
+        return self.cache.call(namespace, {'prompt': prompt, 'settings': settings},
+                               lambda: self.lm(prompt, **kwargs))
+
+    def copy(self, **kwargs):
+        return CachedLM(self.lm.copy(**kwargs), self.cache)
+
+    def __deepcopy__(self, memo):
+        # Copies (e.g. of a program holding this LM) share the cache and its SQLite connection
+        return CachedLM(copy.deepcopy(self.lm, memo), self.cache)
+
+    def __getattr__(self, name):
+        # Only reached for attributes CachedLM lacks; guards copy/pickle before __init__ has run
+        if name == 'lm':
+            raise AttributeError(name)
+        return getattr(self.lm, name)
+
+
+def _file_digests(args, kwargs) -> Dict[str, str]:
+    """Content hashes of the string arguments that name existing files."""
+    digests = {}
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, str) and value and len(value) < 4096 and os.path.isfile(value):
+            digests[value] = file_digest(value)
+    return digests
@@ -0,0 +1,80 @@
+"""Streaming, sharded reader for MedRAX sample files (a JSON array or JSON lines)."""
+import json
+from typing import Dict, Iterator, Optional
+
+# Characters read at a time from a JSON array file
+READ_CHUNK = 1024 * 1024
+
+
+def iter_json_array(path: str) -> Iterator[Dict]:
+    """
+    Items of a top-level JSON array, decoded one at a time.
+
+    Only the current chunk and the item being decoded are held in memory,
+    instead of the whole file plus every parsed item.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(READ_CHUNK)
+        while buffer.isspace():
+            buffer = f.read(READ_CHUNK)
+        buffer = buffer.lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{path}: expected a JSON array")
+        pos = 1
+        eof = False
+        while True:
+            # Skip whitespace and the separator before the next item
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                buffer, pos = f.read(READ_CHUNK), 0
+                eof = not buffer
+            if pos >= len(buffer) or buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Item runs past the buffer: read more and retry
+                more = f.read(READ_CHUNK)
+                if not more:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            yield item
+            pos = end
+
+
+def iter_json_lines(path: str) -> Iterator[Dict]:
+    """Items of a JSON lines file; blank lines are skipped."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_samples(path: str, shard: int = 0, num_shards: int = 1, limit: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Samples from a JSON array or a .jsonl file, read lazily.
+
+    Args:
+        path: Sample file; `.jsonl` files are read line by line
+        shard: Index of the shard to keep, in [0, num_shards)
+        num_shards: Keep every num_shards-th sample, starting at `shard`
+        limit: Stop after this many samples of the shard
+
+    Returns:
+        Iterator over the shard's sample dicts, in file order
+    """
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"shard {shard} out of range for {num_shards} shards")
+    items = iter_json_lines(path) if path.endswith('.jsonl') else iter_json_array(path)
+    kept = 0
+    for index, item in enumerate(items):
+        if limit is not None and kept >= limit:
+            return
+        if index % num_shards == shard:
+            kept += 1
+            yield item
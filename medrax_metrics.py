@@ -0,0 +1,7 @@
+"""Metrics shared by MedRAX training (train_medrax.py) and evaluation (evaluate.py)."""
+
+
+# If the agent's answer matches the gold standard, it gets a point.
+def medical_accuracy_metric(example, prediction, trace=None):
+    # Simple containment check as per blueprint
+    return example.answer.lower() in prediction.answer.lower()
@@ -0,0 +1,207 @@
+"""Local mock of the OpenRouter chat-completions endpoint for benchmarks and offline testing."""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+LISTEN_BACKLOG = 1024
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this Nagle + delayed ACK add ~40ms per response
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        mock = self.server.mock
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f'unknown path {self.path}'}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        outcome, delay = mock.next_outcome()
+        time.sleep(delay)
+        if outcome == 'rate_limited':
+            self._send_json(429, {'error': {'message': 'rate limited'}}, {'Retry-After': str(mock.retry_after)})
+        elif outcome == 'error':
+            self._send_json(503, {'error': {'message': 'upstream unavailable'}})
+        elif outcome == 'disconnect' and not body.get('stream'):
+            self.close_connection = True
+        elif body.get('stream'):
+            self._stream(body, mock, outcome == 'disconnect')
+        else:
+            self._send_json(200, mock.completion(body))
+
+    def _stream(self, body: Dict, mock: 'MockOpenRouter', disconnect: bool = False):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self._chunk(b': OPENROUTER PROCESSING\n\n')
+        words = mock.reply_words(body)
+        for word in words[:len(words) // 2] if disconnect else words:
+            time.sleep(mock.chunk_delay)
+            event = {'model': body.get('model'), 'choices': [{'delta': {'content': word}}]}
+            self._chunk(f'data: {json.dumps(event)}\n\n'.encode('utf-8'))
+        if disconnect:
+            # Drop the connection mid-body, without the terminating chunk
+            self.close_connection = True
+            return
+        self._chunk(b'data: [DONE]\n\n')
+        self._chunk(b'')
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockHTTPServer(ThreadingHTTPServer):
+    request_queue_size = LISTEN_BACKLOG
+
+    def handle_error(self, request, client_address):
+        # Clients closing keep-alive connections (or abandoning streams) are not errors here
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class MockOpenRouter:
+    """
+    In-process stand-in for https://openrouter.ai/api/v1/chat/completions.
+
+    Every request waits `latency` seconds (plus uniform `jitter`), then
+    fails with a 503 with probability `error_rate`, is throttled with a 429
+    and Retry-After with probability `rate_limit_rate`, or answers with
+    `reply_tokens` words and a `usage` block. Streamed requests send one SSE
+    chunk per word, `chunk_delay` seconds apart. Outcomes come from a seeded
+    generator, so a run is reproducible for a given request order;
+    queue_outcomes() fixes the next few outright, and can also queue a
+    'disconnect' (the connection drops before the reply, or halfway
+    through a stream).
+
+    Point the clients at it with OPENROUTER_BASE_URL=<base_url>.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.05, jitter: float = 0.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 0.1,
+                 reply_tokens: int = 32, chunk_delay: float = 0.005, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.reply_tokens = reply_tokens
+        self.chunk_delay = chunk_delay
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {'ok': 0, 'error': 0, 'rate_limited': 0, 'disconnect': 0}
+        self._queued = deque()
+        self.server = MockHTTPServer((host, port), MockHandler)
+        self.server.daemon_threads = True
+        self.server.mock = self
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/api/v1'
+
+    def queue_outcomes(self, *outcomes: str):
+        """Answer the next requests with these outcomes ('ok', 'error', 'rate_limited', 'disconnect') first."""
+        with self._lock:
+            self._queued.extend(outcomes)
+
+    def next_outcome(self):
+        """(outcome, delay in seconds) for the next request."""
+        with self._lock:
+            draw = self._random.random()
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if self._queued:
+                outcome = self._queued.popleft()
+            elif draw < self.error_rate:
+                outcome = 'error'
+            elif draw < self.error_rate + self.rate_limit_rate:
+                outcome = 'rate_limited'
+            else:
+                outcome = 'ok'
+            self.counts[outcome] += 1
+        return outcome, delay
+
+    def reply_words(self, body: Dict):
+        model = body.get('model', 'mock')
+        return [f'{model}-token{i} ' for i in range(self.reply_tokens)]
+
+    def completion(self, body: Dict) -> Dict:
+        prompt = ' '.join(str(m.get('content', '')) for m in body.get('messages', []))
+        prompt_tokens = len(prompt) // 4 + 1
+        return {
+            'id': 'mock-completion',
+            'model': body.get('model'),
+            'choices': [{'message': {'role': 'assistant', 'content': ''.join(self.reply_words(body))},
+                         'finish_reason': 'stop'}],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': self.reply_tokens,
+                'total_tokens': prompt_tokens + self.reply_tokens
+            }
+        }
+
+    def start(self) -> 'MockOpenRouter':
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.server.serve_forever, name='mock-openrouter', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server.server_close()
+
+    def __enter__(self) -> 'MockOpenRouter':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Mock OpenRouter chat-completions server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--reply-tokens', type=int, default=32)
+    parser.add_argument('--chunk-delay-ms', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    mock = MockOpenRouter(args.host, args.port, args.latency_ms / 1000.0, args.jitter_ms / 1000.0,
+                          args.error_rate, args.rate_limit_rate, reply_tokens=args.reply_tokens,
+                          chunk_delay=args.chunk_delay_ms / 1000.0, seed=args.seed)
+    print(f"[MOCK] Serving on {mock.base_url} (set OPENROUTER_BASE_URL to this)")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.server.server_close()
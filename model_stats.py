@@ -0,0 +1,176 @@
+"""Live per-model latency, throughput and error statistics with a circuit breaker."""
+import threading
+import time
+import numpy as np
+from collections import deque
+from typing import Dict, List, Optional
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a model whose circuit is open, or half-open with a probe in flight."""
+
+    def __init__(self, model: str):
+        super().__init__(f"circuit open for {model}")
+        self.model = model
+
+
+class ModelStats:
+    """
+    Online statistics for each model, fed by real OpenRouter calls.
+
+    Latency, tokens/sec and error rate are exponentially weighted moving
+    averages (weight `alpha` on the newest sample). After
+    `failure_threshold` consecutive failures a model's circuit opens for
+    `cooldown` seconds. Once that expires the circuit is half-open:
+    admit() lets a single probe request through, and its success closes
+    the circuit while its failure re-opens it for another `cooldown`. A
+    probe that never reports back (e.g. an abandoned stream) is given up
+    after `cooldown` seconds and another one is admitted. The last
+    `window` successful latencies are kept for percentiles.
+    """
+
+    def __init__(self, alpha: float = 0.2, failure_threshold: int = 5, cooldown: float = 30.0,
+                 window: int = 200):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.window = window
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def configure(self, alpha: float, failure_threshold: int, cooldown: float):
+        """Apply new settings (e.g. after a router reload); per-model history and open circuits are kept."""
+        with self._lock:
+            self.alpha = alpha
+            self.failure_threshold = failure_threshold
+            self.cooldown = cooldown
+
+    def _entry(self, model: str) -> Dict:
+        entry = self._models.get(model)
+        if entry is None:
+            entry = self._models[model] = {
+                'latency': None,
+                'tokens_per_second': None,
+                'error_rate': 0.0,
+                'requests': 0,
+                'failures': 0,
+                'consecutive_failures': 0,
+                'open_until': 0.0,
+                'probe_started': None,
+                'recent': deque(maxlen=self.window)
+            }
+        return entry
+
+    def _ewma(self, old: Optional[float], new: float) -> float:
+        return new if old is None else (1 - self.alpha) * old + self.alpha * new
+
+    def record_success(self, model: str, latency: float, completion_tokens: Optional[int] = None):
+        """Record a completed call and its wall-clock latency in seconds."""
+        with self._lock:
+            entry = self._entry(model)
+            entry['requests'] += 1
+            entry['latency'] = self._ewma(entry['latency'], latency)
+            entry['recent'].append(latency)
+            if completion_tokens and latency > 0:
+                entry['tokens_per_second'] = self._ewma(entry['tokens_per_second'], completion_tokens / latency)
+            entry['error_rate'] = self._ewma(entry['error_rate'], 0.0)
+            entry['consecutive_failures'] = 0
+            entry['open_until'] = 0.0
+            entry['probe_started'] = None
+
+    def record_failure(self, model: str, latency: Optional[float] = None):
+        """Record a failed call; opens the circuit after too many failures in a row."""
+        with self._lock:
+            entry = self._entry(model)
+            entry['requests'] += 1
+            entry['failures'] += 1
+            if latency is not None:
+                entry['latency'] = self._ewma(entry['latency'], latency)
+            entry['error_rate'] = self._ewma(entry['error_rate'], 1.0)
+            entry['consecutive_failures'] += 1
+            # A failed probe re-opens the circuit straight away
+            if entry['probe_started'] is not None or entry['consecutive_failures'] >= self.failure_threshold:
+                entry['open_until'] = time.monotonic() + self.cooldown
+                entry['consecutive_failures'] = 0
+                entry['probe_started'] = None
+
+    def admit(self, model: str) -> bool:
+        """
+        Whether a request may be sent to the model now.
+
+        Always True while the circuit is closed. False while it is open, and
+        while it is half-open with a probe in flight; otherwise the caller
+        becomes the probe and must report its outcome through
+        record_success() or record_failure().
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._models.get(model)
+            if entry is None or not entry['open_until']:
+                return True
+            if entry['open_until'] > now:
+                return False
+            probe_started = entry['probe_started']
+            if probe_started is not None and now - probe_started < self.cooldown:
+                return False
+            entry['probe_started'] = now
+            return True
+
+    def release_probe(self, model: str):
+        """Give up a probe that ended without a health verdict (e.g. a 4xx caused by the request itself)."""
+        with self._lock:
+            entry = self._models.get(model)
+            if entry is not None:
+                entry['probe_started'] = None
+
+    def _blocked(self, entry: Dict, now: float) -> bool:
+        """Open, or half-open with a live probe: no request but the probe should go there."""
+        if not entry['open_until']:
+            return False
+        if entry['open_until'] > now:
+            return True
+        probe_started = entry['probe_started']
+        return probe_started is not None and now - probe_started < self.cooldown
+
+    def is_open(self, model: str) -> bool:
+        """True while the model's circuit breaker is open or probing."""
+        with self._lock:
+            entry = self._models.get(model)
+            return entry is not None and self._blocked(entry, time.monotonic())
+
+    def latency_percentile(self, model: str, q: float = 95) -> Optional[float]:
+        """q-th percentile of recent successful latencies, or None before any success."""
+        with self._lock:
+            recent = list(self._models.get(model, {}).get('recent', ()))
+        return float(np.percentile(recent, q)) if recent else None
+
+    def latencies(self, models: List[str]) -> np.ndarray:
+        """EWMA latency per model in seconds, NaN where nothing has been observed yet."""
+        with self._lock:
+            return np.array([
+                np.nan if self._models.get(m, {}).get('latency') is None else self._models[m]['latency']
+                for m in models
+            ], dtype=np.float64)
+
+    def open_circuits(self, models: List[str]) -> np.ndarray:
+        """Boolean mask of models whose circuit breaker is currently open or probing."""
+        now = time.monotonic()
+        with self._lock:
+            return np.array([m in self._models and self._blocked(self._models[m], now) for m in models],
+                            dtype=bool)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Copy of every model's statistics."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                model: {
+                    'latency': entry['latency'],
+                    'tokens_per_second': entry['tokens_per_second'],
+                    'error_rate': entry['error_rate'],
+                    'requests': entry['requests'],
+                    'failures': entry['failures'],
+                    'circuit_open': self._blocked(entry, now)
+                }
+                for model, entry in self._models.items()
+            }
@@ -0,0 +1,299 @@
+"""Pooled, keep-alive HTTP clients (sync and asyncio) for the OpenRouter chat-completions API."""
+import asyncio
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+
+# Upstream throttling and transient server errors are worth another attempt
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Failures before the request reached the server. A read timeout is not retried:
+# the completion may already be running (and billed) upstream.
+ASYNC_RETRY_ERRORS = ('ConnectError', 'ConnectTimeout', 'PoolTimeout')
+
+
+class OpenRouterClient:
+    """
+    Reusable OpenRouter client.
+
+    One requests.Session with a sized connection pool is shared by every
+    call, so TCP+TLS setup is paid once per connection rather than per call.
+    Each request has connect/read timeouts, and 429/5xx responses or
+    failures to connect are retried with jittered exponential backoff that
+    honors the Retry-After header. Read timeouts and connections dropped
+    after the request was sent are not retried, since the completion may
+    already be running (and billed) upstream. Point `base_url` (or
+    OPENROUTER_BASE_URL) at a local stand-in server to test without the
+    real API.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 connect_timeout: float = 5.0, read_timeout: float = 120.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 pool_size: int = 32):
+        self.api_key = api_key
+        self.base_url = (base_url or os.getenv('OPENROUTER_BASE_URL') or DEFAULT_BASE_URL).rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+
+        self.session = requests.Session()
+        # Retries are handled here so Retry-After and jitter apply; urllib3 must not retry too
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _headers(self) -> Dict[str, str]:
+        api_key = self.api_key or os.getenv('OPENROUTER_API_KEY')
+        if not api_key:
+            raise ValueError("OPENROUTER_API_KEY environment variable not set. Please set it before running.")
+        return {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://github.com/your-repo",
+            "X-Title": "LLM Router Demo"
+        }
+
+    def post(self, path: str, payload: Dict, stream: bool = False) -> requests.Response:
+        """POST to the API, retrying throttled, failed and unreachable attempts."""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        headers = self._headers()
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(url, headers=headers, json=payload,
+                                             timeout=self.timeout, stream=stream)
+            except requests.ConnectionError as e:
+                if not _connect_failed(e) or attempt >= self.max_retries:
+                    raise
+                self._sleep(attempt, None)
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response
+                self._sleep(attempt, response)
+                response.close()
+            attempt += 1
+            with self._retries_lock:
+                self.retries += 1
+
+    def _sleep(self, attempt: int, response: Optional[requests.Response]):
+        time.sleep(self.backoff_delay(attempt, response))
+
+    def backoff_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Seconds to wait before retry `attempt` (0-based): Retry-After if given, else full jitter."""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        return _backoff_delay(attempt, retry_after, self.backoff_base, self.backoff_max)
+
+    def chat_completion(self, model: str, messages: List[Dict], **params) -> Dict:
+        """Run one chat completion and return the parsed JSON response."""
+        payload = {"model": model, "messages": messages, **params}
+        return self.post('chat/completions', payload).json()
+
+    def complete(self, prompt: str, model: str, **params) -> str:
+        """Send a single user prompt and return the completion text."""
+        result = self.chat_completion(model, [{"role": "user", "content": prompt}], **params)
+        return result['choices'][0]['message']['content']
+
+    def stream_completion(self, prompt: str, model: str, **params) -> Iterator[str]:
+        """
+        Start a streaming completion and return an iterator of text chunks.
+
+        The request is sent (and retried) before this returns, so HTTP errors
+        surface here; the body is read lazily as the iterator is consumed.
+        """
+        payload = {"model": model, "messages": [{"role": "user", "content": prompt}], "stream": True, **params}
+        response = self.post('chat/completions', payload, stream=True)
+        return self._iter_chunks(response)
+
+    @staticmethod
+    def _iter_chunks(response: requests.Response) -> Iterator[str]:
+        try:
+            # chunk_size=None yields data as it arrives instead of buffering 512 bytes
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                event = parse_sse_line(line)
+                if event is DONE:
+                    break
+                if event:
+                    yield event
+        finally:
+            response.close()
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncOpenRouterClient:
+    """
+    asyncio counterpart of OpenRouterClient, built on httpx.AsyncClient.
+
+    Same pooling, timeout and retry behaviour. An instance is tied to the
+    event loop it is first used on, so `retries` needs no lock.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 connect_timeout: float = 5.0, read_timeout: float = 120.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 pool_size: int = 100):
+        import httpx
+
+        self._httpx = httpx
+        self._retry_errors = tuple(getattr(httpx, name) for name in ASYNC_RETRY_ERRORS)
+        self.api_key = api_key
+        self.base_url = (base_url or os.getenv('OPENROUTER_BASE_URL') or DEFAULT_BASE_URL).rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    _headers = OpenRouterClient._headers
+
+    async def post(self, path: str, payload: Dict):
+        """POST to the API, retrying throttled, failed and unreachable attempts."""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        headers = self._headers()
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.post(url, headers=headers, json=payload)
+            except self._retry_errors:
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = None
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response
+                retry_after = response.headers.get('Retry-After')
+            await asyncio.sleep(_backoff_delay(attempt, retry_after, self.backoff_base, self.backoff_max))
+            attempt += 1
+            self.retries += 1
+
+    async def chat_completion(self, model: str, messages: List[Dict], **params) -> Dict:
+        """Run one chat completion and return the parsed JSON response."""
+        payload = {"model": model, "messages": messages, **params}
+        return (await self.post('chat/completions', payload)).json()
+
+    async def complete(self, prompt: str, model: str, **params) -> str:
+        """Send a single user prompt and return the completion text."""
+        result = await self.chat_completion(model, [{"role": "user", "content": prompt}], **params)
+        return result['choices'][0]['message']['content']
+
+    async def stream_completion(self, prompt: str, model: str, **params) -> AsyncIterator[str]:
+        """
+        Start a streaming completion and return an async iterator of text chunks.
+
+        The request is sent (and retried) before this returns, so HTTP errors
+        surface here; the body is read lazily as the iterator is consumed.
+        """
+        payload = {"model": model, "messages": [{"role": "user", "content": prompt}], "stream": True, **params}
+        url = f"{self.base_url}/chat/completions"
+        headers = self._headers()
+        attempt = 0
+        while True:
+            try:
+                request = self.client.build_request('POST', url, headers=headers, json=payload)
+                response = await self.client.send(request, stream=True)
+            except self._retry_errors:
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = None
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    if response.is_error:
+                        await response.aread()
+                        await response.aclose()
+                    response.raise_for_status()
+                    return self._iter_chunks(response)
+                retry_after = response.headers.get('Retry-After')
+                await response.aclose()
+            await asyncio.sleep(_backoff_delay(attempt, retry_after, self.backoff_base, self.backoff_max))
+            attempt += 1
+            self.retries += 1
+
+    @staticmethod
+    async def _iter_chunks(response) -> AsyncIterator[str]:
+        try:
+            async for line in response.aiter_lines():
+                event = parse_sse_line(line)
+                if event is DONE:
+                    break
+                if event:
+                    yield event
+        finally:
+            await response.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# Sentinel returned by parse_sse_line for the end-of-stream marker
+DONE = object()
+
+
+def parse_sse_line(line: str):
+    """
+    Parse one line of an OpenRouter server-sent-events stream.
+
+    Returns the text delta it carries, DONE for the `data: [DONE]` marker,
+    or None for keep-alive comments, blank lines and chunks without text.
+    """
+    if not line or not line.startswith('data:'):
+        return None
+    data = line[len('data:'):].strip()
+    if data == '[DONE]':
+        return DONE
+    try:
+        chunk = json.loads(data)
+    except ValueError:
+        return None
+    if chunk.get('error'):
+        raise RuntimeError(f"OpenRouter stream error: {chunk['error']}")
+    choices = chunk.get('choices') or []
+    if not choices:
+        return None
+    return (choices[0].get('delta') or {}).get('content') or None
+
+
+def _connect_failed(error: requests.ConnectionError) -> bool:
+    """True if the connection was never established, so the request cannot have reached the server."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def _backoff_delay(attempt: int, retry_after: Optional[str], base: float, cap: float) -> float:
+    if retry_after:
+        delay = _parse_retry_after(retry_after)
+        if delay is not None:
+            return min(delay, cap)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _parse_retry_after(value: str) -> Optional[float]:
+    """Retry-After is either delta-seconds or an HTTP date."""
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
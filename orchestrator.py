@@ -1,127 +1,809 @@
 """Step 9: Core orchestrator - Route prompts and call OpenRouter."""
-from sentence_transformers import SentenceTransformer
-import json
-import yaml
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+import asyncio
+import concurrent.futures
+import logging
 import os
-import requests
-from typing import Dict
-
-# Load configuration
-with open('knn_router.yaml', 'r') as f:
-    config = yaml.safe_load(f)
-
-# Load model candidates
-with open('model_candidates.json', 'r') as f:
-    models = json.load(f)
-
-# Initialize embedding model
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-
-# Extract model embeddings from config
-llm_data = config['llm_data']
-model_embeddings = {}
-model_info = {}
-
-for model_name, data in llm_data.items():
-    model_embeddings[data['model']] = np.array(data['embedding'])
-    model_info[data['model']] = {
-        'cost': data['cost'],
-        'max_tokens': data['max_tokens']
+import threading
+import time
+import weakref
+from typing import Dict, List
+
+from embedding_cache import EmbeddingCache, normalize_prompt
+from model_stats import CircuitOpenError
+from openrouter_client import AsyncOpenRouterClient, OpenRouterClient
+from request_log import DEFAULT_REQUEST_LOG, RequestLog
+from rate_limiter import CHARS_PER_TOKEN, RateLimitExceeded, estimate_tokens, key_id
+from response_cache import SemanticResponseCache
+from router import Router
+from singleflight import AsyncSingleFlight, SingleFlight
+from streaming import AsyncStreamingResponse, StreamingResponse
+from telemetry import Metrics
+
+logger = logging.getLogger(__name__)
+
+# Stage timers, per-model latency histograms, token/cost and cache/retry counters
+# (see export_metrics); set ROUTER_PROFILE=1 to also profile orchestrate() with cProfile
+metrics = Metrics()
+if os.getenv('ROUTER_PROFILE'):
+    metrics.enable_profiling()
+
+# llm_data `cost` is USD per million tokens; used when the response carries no `usage.cost`
+COST_PER_TOKENS = 1_000_000
+
+# Repeated prompts skip the encoder; set ROUTER_EMBEDDING_CACHE to a file path
+# to also keep embeddings across restarts in SQLite
+embedding_cache = EmbeddingCache(max_entries=10000, path=os.getenv('ROUTER_EMBEDDING_CACHE'))
+
+# Router state (manifest, embedding matrix, encoder) loads lazily on first use
+router = Router('knn_router.yaml', embedding_cache=embedding_cache)
+
+# Set ROUTER_WATCH_INTERVAL (seconds) to reload the router whenever knn_router.yaml changes
+if os.getenv('ROUTER_WATCH_INTERVAL'):
+    router.watch(float(os.getenv('ROUTER_WATCH_INTERVAL')))
+
+# Shared keep-alive OpenRouter client (timeouts, retry with backoff)
+client = OpenRouterClient()
+
+# Async path limits: in-flight OpenRouter requests overall and per model
+MAX_CONCURRENT_REQUESTS = 64
+MAX_CONCURRENT_PER_MODEL = 16
+
+# Fallback: how many runner-up models to try after the selected one fails
+# (or is throttled by the client-side rate limits for longer than their spill wait)
+MAX_FALLBACKS = 2
+
+# Hedging: wait this long (or the primary's observed p95 latency, once known)
+# before also asking the runner-up; the first answer wins
+DEFAULT_HEDGE_DELAY = 2.0
+HEDGE_PERCENTILE = 95
+_hedge_pool = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix='hedge')
+
+# Identical concurrent requests share one encode and one (non-streamed) OpenRouter call
+encode_flight = SingleFlight()
+call_flight = SingleFlight()
+async_encode_flight = AsyncSingleFlight()
+async_call_flight = AsyncSingleFlight()
+
+# Async client and semaphores are bound to an event loop, so keep one set per loop;
+# each client is closed when its loop shuts down (see _async_state)
+_async_states = weakref.WeakKeyDictionary()
+
+# Opt-in cache of OpenRouter answers for near-duplicate prompts (see enable_response_cache)
+response_cache = None
+
+# Opt-in JSONL log of every request for replay.py; set ROUTER_REQUEST_LOG to a path to enable it
+# at import (ROUTER_REQUEST_LOG_PROMPTS=1 also stores prompt text, which replay needs to re-route)
+request_log = None
+if os.getenv('ROUTER_REQUEST_LOG'):
+    request_log = RequestLog(os.getenv('ROUTER_REQUEST_LOG'), bool(os.getenv('ROUTER_REQUEST_LOG_PROMPTS')))
+
+def enable_request_log(path: str = DEFAULT_REQUEST_LOG, include_prompts: bool = False) -> RequestLog:
+    """Append a record of every orchestrated request to `path` (JSON lines)."""
+    global request_log
+    disable_request_log()
+    request_log = RequestLog(path, include_prompts)
+    return request_log
+
+def disable_request_log():
+    """Stop logging requests and close the log file."""
+    global request_log
+    log, request_log = request_log, None
+    if log is not None:
+        log.close()
+
+def enable_response_cache(threshold: float = 0.95, ttl: float = 3600.0,
+                          max_entries: int = 1000) -> SemanticResponseCache:
+    """Turn on the semantic response cache for orchestrate() and orchestrate_many()."""
+    global response_cache
+    response_cache = SemanticResponseCache(threshold=threshold, ttl=ttl, max_entries=max_entries)
+    return response_cache
+
+def disable_response_cache():
+    """Turn the semantic response cache off again."""
+    global response_cache
+    response_cache = None
+
+def rate_limit_stats() -> Dict:
+    """Requests admitted, delayed and rejected by the client-side rate limits, per model."""
+    return router.limiter.stats()
+
+def coalescing_stats() -> Dict[str, Dict[str, int]]:
+    """How many encodes and upstream calls ran versus were shared with an identical in-flight one."""
+    return {
+        "encode": encode_flight.stats(),
+        "upstream": call_flight.stats(),
+        "encode_async": async_encode_flight.stats(),
+        "upstream_async": async_call_flight.stats()
     }
 
+def export_metrics(fmt: str = 'prometheus') -> str:
+    """All orchestrator metrics as Prometheus text (fmt='prometheus') or JSON (fmt='json')."""
+    return metrics.to_json() if fmt == 'json' else metrics.to_prometheus()
+
+def _collect_gauges() -> List[tuple]:
+    """Counters kept by the caches, clients, limiter and router themselves, read at export time."""
+    gauges = []
+    for result in ('hits', 'disk_hits', 'misses'):
+        gauges.append(('embedding_cache', {'result': result}, getattr(embedding_cache, result)))
+    if response_cache is not None:
+        for result in ('hits', 'misses'):
+            gauges.append(('response_cache', {'result': result}, getattr(response_cache, result)))
+    gauges.append(('upstream_retries', {'client': 'sync'}, client.retries))
+    gauges.append(('upstream_retries', {'client': 'async'},
+                   sum(state["client"].retries for state in list(_async_states.values()))))
+    for name, flight_stats in coalescing_stats().items():
+        for kind, value in flight_stats.items():
+            gauges.append(('coalescing', {'flight': name, 'kind': kind}, value))
+    for stage, value in router.stage_counts.items():
+        gauges.append(('routing_stage_decisions', {'stage': stage}, value))
+    gauges.append(('reloads', {}, router.reloads))
+    if router._limiter is not None:
+        for model, counts in router.limiter.stats()['models'].items():
+            for kind in ('admitted', 'delayed', 'rejected'):
+                gauges.append(('rate_limit_requests', {'model': model, 'result': kind}, counts[kind]))
+    return sorted(gauges, key=lambda gauge: gauge[0])
+
+metrics.add_collector(_collect_gauges)
+
+def reload_router() -> bool:
+    """Reload knn_router.yaml now; in-flight requests finish on the previous snapshot."""
+    return router.reload()
+
+def warmup() -> Dict[str, float]:
+    """Load the router and encoder ahead of the first request; returns phase timings."""
+    return router.warmup()
+
 def route_prompt(prompt: str) -> tuple:
     """Route a prompt to the best model based on embeddings and cost."""
-    # Generate embedding for the prompt
-    prompt_embedding = embedding_model.encode([prompt])[0]
-    
-    # Calculate cosine similarity with each model
-    similarities = {}
-    for model, model_emb in model_embeddings.items():
-        similarity = cosine_similarity([prompt_embedding], [model_emb])[0][0]
-        # Combine similarity with cost (lower cost = higher score)
-        cost_score = 1.0 - model_info[model]['cost']  # Invert cost
-        # Weight: 70% similarity, 30% cost preference
-        combined_score = 0.7 * similarity + 0.3 * cost_score
-        similarities[model] = {
-            'similarity': similarity,
-            'cost': model_info[model]['cost'],
-            'combined_score': combined_score
-        }
-    
-    # Select model with highest combined score
-    selected_model = max(similarities.items(), key=lambda x: x[1]['combined_score'])[0]
-    
-    return selected_model, similarities[selected_model]
+    return router.route_prompt(prompt)
+
+def route_batch(prompts: List[str], batch_size: int = 64) -> List[tuple]:
+    """Route many prompts with one padded encode and one matrix product."""
+    return router.route_batch(prompts, batch_size)
+
+def rank_prompt(prompt: str) -> List[tuple]:
+    """All candidate models for a prompt as (model, scores) pairs, best first."""
+    return router.rank_prompt(prompt)
 
 def call_openrouter(prompt: str, model: str) -> str:
     """Call OpenRouter API with the selected model."""
-    api_key = os.getenv('OPENROUTER_API_KEY')
-    if not api_key:
-        raise ValueError("OPENROUTER_API_KEY environment variable not set. Please set it before running.")
-    
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://github.com/your-repo",
-        "X-Title": "LLM Router Demo"
-    }
-    
-    data = {
-        "model": model,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ]
-    }
-    
-    response = requests.post(url, headers=headers, json=data)
-    response.raise_for_status()
-    
-    result = response.json()
-    return result['choices'][0]['message']['content']
+    return client.complete(prompt, model)
 
-def orchestrate(prompt: str) -> Dict:
+def _messages(prompt: str) -> List[Dict]:
+    return [{"role": "user", "content": prompt}]
+
+def orchestrate(prompt: str, use_cache: bool = True, stream: bool = False,
+                fallback: bool = True, hedge: bool = False, hedge_delay: float = None) -> Dict:
     """
     Main orchestration function that routes a prompt and calls OpenRouter.
     
     Args:
         prompt: The input prompt to route and process
+        use_cache: Set to False to bypass the response cache for this request
+        stream: Return the response as a StreamingResponse of text chunks;
+            time_to_first_token and generation_time are filled into
+            routing_metadata as it is consumed
+        fallback: On error or timeout, retry with the next-best models
+            (up to MAX_FALLBACKS of them); a model whose rate limit would
+            hold the request longer than the spill wait is skipped too
+        hedge: If the selected model has not answered after `hedge_delay`
+            seconds, also ask the runner-up and keep the first answer
+            (ignored when streaming)
+        hedge_delay: Defaults to the selected model's observed p95 latency
         
     Returns:
         Dictionary with model_used, response, and estimated_cost
     """
-    # Step 1: Route the prompt
-    selected_model, routing_info = route_prompt(prompt)
-    
-    # Step 2: Log routing decision
-    print(f"[ROUTING] Prompt: {prompt[:50]}...")
-    print(f"[ROUTING] Selected Model: {selected_model}")
-    print(f"[ROUTING] Similarity: {routing_info['similarity']:.4f}, Cost: {routing_info['cost']:.2f}")
+    with metrics.profiled():
+        # Step 1: Route the prompt; the encoder only runs if the lexical stage is unsure
+        # (the embedding is reused by the response cache)
+        table = router.table  # one snapshot for both routing stages, even across a reload
+        candidates = _lexical_rankings([prompt], use_cache, table)[0]
+        prompt_embedding = None
+        if candidates is None:
+            with metrics.timer('encode'):
+                prompt_embedding, _ = encode_flight.do(normalize_prompt(prompt), lambda: router.encode([prompt])[0])
+            with metrics.timer('score'):
+                candidates = router.rank_embeddings([prompt_embedding], table)[0]
+        
+        # Steps 2-4: Log, call OpenRouter and compute cost
+        return _complete(prompt, candidates, prompt_embedding, use_cache, stream, fallback, hedge, hedge_delay)
+
+def orchestrate_many(prompts: List[str], batch_size: int = 64, use_cache: bool = True,
+                     fallback: bool = True, hedge: bool = False, hedge_delay: float = None) -> List[Dict]:
+    """
+    Route a list of prompts in one batch, then call OpenRouter for each.
     
-    # Step 3: Call OpenRouter
-    try:
-        response_text = call_openrouter(prompt, selected_model)
+    Args:
+        prompts: The input prompts to route and process
+        batch_size: Encoder batch size used for routing
+        use_cache: Set to False to bypass the response cache for these requests
+        fallback, hedge, hedge_delay: As for orchestrate()
         
-        # Step 4: Estimate cost (simplified: cost per token approximation)
-        # This is a rough estimate - actual cost depends on input/output tokens
-        estimated_cost = routing_info['cost'] * 0.001  # Rough estimate
+    Returns:
+        One result per prompt, in input order. A prompt whose OpenRouter call
+        failed gets {"prompt", "model_used", "error"} instead of raising.
+    """
+    if not prompts:
+        return []
+    with metrics.profiled():
+        table = router.table
+        rankings = _lexical_rankings(prompts, use_cache, table)
+        undecided = [row for row, ranked in enumerate(rankings) if ranked is None]
+        encoded = []
+        if undecided:
+            with metrics.timer('encode'):
+                encoded = router.encode([prompts[row] for row in undecided], batch_size)
+        prompt_embeddings = _merge_encoded(rankings, undecided, encoded, table)
+        
+        results = []
+        for prompt, prompt_embedding, candidates in zip(prompts, prompt_embeddings, rankings):
+            try:
+                results.append(_complete(prompt, candidates, prompt_embedding, use_cache,
+                                         False, fallback, hedge, hedge_delay))
+            except Exception as e:
+                results.append({
+                    "prompt": prompt,
+                    "model_used": candidates[0][0],
+                    "error": str(e)
+                })
+        return results
+
+async def orchestrate_async(prompt: str, use_cache: bool = True, stream: bool = False,
+                            fallback: bool = True, hedge: bool = False, hedge_delay: float = None) -> Dict:
+    """
+    asyncio version of orchestrate().
+    
+    Loading the router, scoring and encoding run in the default executor so
+    the event loop stays free, and the OpenRouter call waits on the global
+    and per-model concurrency limits.
+    With stream=True the response is an AsyncStreamingResponse; it holds its
+    concurrency slot until it is fully consumed or closed with aclose().
+    """
+    loop = asyncio.get_running_loop()
+    # One snapshot for both routing stages, even across a reload
+    table, rankings = await loop.run_in_executor(None, _lexical_stage, [prompt], use_cache)
+    candidates = rankings[0]
+    prompt_embedding = None
+    if candidates is None:
+        with metrics.timer('encode'):
+            prompt_embeddings, _ = await async_encode_flight.do(
+                normalize_prompt(prompt), lambda: loop.run_in_executor(None, router.encode, [prompt])
+            )
+        prompt_embedding = prompt_embeddings[0]
+        with metrics.timer('score'):
+            candidates = (await loop.run_in_executor(None, router.rank_embeddings, prompt_embeddings, table))[0]
+    return await _complete_async(prompt, candidates, prompt_embedding, use_cache, stream,
+                                 fallback, hedge, hedge_delay)
+
+async def orchestrate_many_async(prompts: List[str], batch_size: int = 64, use_cache: bool = True,
+                                 return_errors: bool = True, fallback: bool = True,
+                                 hedge: bool = False, hedge_delay: float = None) -> List[Dict]:
+    """
+    Route a list of prompts in one batch, then call OpenRouter for all of them concurrently.
+    
+    Args:
+        prompts: The input prompts to route and process
+        batch_size: Encoder batch size used for routing
+        use_cache: Set to False to bypass the response cache for these requests
+        return_errors: Report failures per item instead of raising the first one
+        fallback, hedge, hedge_delay: As for orchestrate(); a losing hedged
+            request is cancelled
         
-        return {
-            "model_used": selected_model,
-            "response": response_text,
-            "estimated_cost": estimated_cost,
-            "routing_metadata": {
-                "similarity": routing_info['similarity'],
-                "model_cost": routing_info['cost']
-            }
+    Returns:
+        One result per prompt, in input order, shaped like orchestrate_many()
+    """
+    if not prompts:
+        return []
+    loop = asyncio.get_running_loop()
+    table, rankings = await loop.run_in_executor(None, _lexical_stage, prompts, use_cache)
+    undecided = [row for row, ranked in enumerate(rankings) if ranked is None]
+    encoded = []
+    if undecided:
+        with metrics.timer('encode'):
+            encoded = await loop.run_in_executor(None, router.encode, [prompts[row] for row in undecided], batch_size)
+    prompt_embeddings = await loop.run_in_executor(None, _merge_encoded, rankings, undecided, encoded, table)
+    
+    tasks = [
+        _complete_async(prompt, candidates, prompt_embedding, use_cache, False, fallback, hedge, hedge_delay)
+        for prompt, prompt_embedding, candidates in zip(prompts, prompt_embeddings, rankings)
+    ]
+    outcomes = await asyncio.gather(*tasks, return_exceptions=return_errors)
+    
+    results = []
+    for prompt, candidates, outcome in zip(prompts, rankings, outcomes):
+        if isinstance(outcome, BaseException):
+            results.append({
+                "prompt": prompt,
+                "model_used": candidates[0][0],
+                "error": str(outcome)
+            })
+        else:
+            results.append(outcome)
+    return results
+
+def _lexical_stage(prompts: List[str], use_cache: bool) -> tuple:
+    """Current snapshot's table (loaded on first use) and its lexical rankings, for the async paths' executor."""
+    table = router.table
+    return table, _lexical_rankings(prompts, use_cache, table)
+
+def _lexical_rankings(prompts: List[str], use_cache: bool, table) -> List:
+    """Lexical-stage rankings (None where undecided); skipped when the response cache needs embeddings."""
+    if use_cache and response_cache is not None:
+        return [None] * len(prompts)
+    with metrics.timer('lexical'):
+        return router.rank_lexical(prompts, table)
+
+def _merge_encoded(rankings: List, undecided: List[int], encoded, table) -> List:
+    """Fill the undecided rankings from their embeddings; returns every prompt's embedding (None if lexical)."""
+    prompt_embeddings = [None] * len(rankings)
+    if len(undecided):
+        with metrics.timer('score'):
+            ranked_encoded = router.rank_embeddings(encoded, table)
+        for row, prompt_embedding, ranked in zip(undecided, encoded, ranked_encoded):
+            rankings[row] = ranked
+            prompt_embeddings[row] = prompt_embedding
+    return prompt_embeddings
+
+async def _async_state() -> Dict:
+    """Async client and concurrency semaphores for the running event loop."""
+    loop = asyncio.get_running_loop()
+    state = _async_states.get(loop)
+    if state is None:
+        state = {
+            "client": AsyncOpenRouterClient(api_key=client.api_key, base_url=client.base_url),
+            "limit": asyncio.Semaphore(MAX_CONCURRENT_REQUESTS),
+            "model_limits": {}
         }
+        _async_states[loop] = state
+        # Parked on the loop until loop.shutdown_asyncgens() (run by asyncio.run()) closes it,
+        # which closes the client's connection pool
+        state["closer"] = _close_on_shutdown(state["client"])
+        await state["closer"].__anext__()
+    return state
+
+async def _close_on_shutdown(async_client: AsyncOpenRouterClient):
+    try:
+        yield
+    finally:
+        await async_client.aclose()
+
+def _complete(prompt: str, candidates: List[tuple], prompt_embedding=None, use_cache: bool = True,
+              stream: bool = False, fallback: bool = True, hedge: bool = False,
+              hedge_delay: float = None) -> Dict:
+    """Call OpenRouter for an already-ranked prompt, falling back down the ranking on failure."""
+    selected_model, routing_info = candidates[0]
+    cache, cached = _before_call(prompt, selected_model, routing_info, prompt_embedding, use_cache)
+    if cached is not None:
+        _log_request(prompt, candidates, cached)
+        if stream:
+            cached["response"] = StreamingResponse([cached["response"]], cached["routing_metadata"])
+        return cached
+    
+    # Step 3: Call OpenRouter, moving down the ranking on failure or throttling
+    failed, spilled, error = [], [], None
+    # After a throttle, only candidates no pricier than the throttled model are tried
+    ceiling = float('inf')
+    groups = _attempt_groups(candidates, fallback, hedge and not stream)
+    for index, group in enumerate(groups):
+        if _group_cost(group) > ceiling:
+            continue
+        max_wait = _max_wait(index, groups)
+        try:
+            if len(group) == 1:
+                winner, (response, usage, started_at, shared) = 0, _call_model(prompt, group[0][0], stream, max_wait)
+            else:
+                winner, (response, usage, started_at, shared) = _hedged(
+                    lambda cancelled: _call_model(prompt, group[0][0], stream, max_wait, cancelled),
+                    lambda cancelled: _call_model(prompt, group[1][0], stream, max_wait, cancelled),
+                    _hedge_delay(group[0][0], hedge_delay)
+                )
+        except Exception as e:
+            if isinstance(e, RateLimitExceeded):
+                spilled.extend(model for model, _ in group)
+                ceiling = min(ceiling, _group_cost(group))
+            else:
+                failed.extend(model for model, _ in group)
+            error = e
+            continue
+        model, info = group[winner]
+        result = _after_call(prompt, model, info, prompt_embedding, cache, response, started_at, usage, shared,
+                             candidates)
+        _annotate(result, failed, group, winner, spilled, selected_model)
+        if not stream:
+            _log_request(prompt, candidates, result)
+        return result
+    _log_request(prompt, candidates, error=error)
+    raise error
+
+async def _complete_async(prompt: str, candidates: List[tuple], prompt_embedding=None, use_cache: bool = True,
+                          stream: bool = False, fallback: bool = True, hedge: bool = False,
+                          hedge_delay: float = None) -> Dict:
+    """Async _complete(): calls wait on the concurrency semaphores and losing hedges are cancelled."""
+    selected_model, routing_info = candidates[0]
+    cache, cached = _before_call(prompt, selected_model, routing_info, prompt_embedding, use_cache)
+    if cached is not None:
+        _log_request(prompt, candidates, cached)
+        if stream:
+            cached["response"] = AsyncStreamingResponse(_aiter([cached["response"]]), cached["routing_metadata"])
+        return cached
+    
+    # Step 3: Call OpenRouter within the global and per-model limits, moving down the ranking on failure
+    failed, spilled, error = [], [], None
+    # After a throttle, only candidates no pricier than the throttled model are tried
+    ceiling = float('inf')
+    groups = _attempt_groups(candidates, fallback, hedge and not stream)
+    for index, group in enumerate(groups):
+        if _group_cost(group) > ceiling:
+            continue
+        max_wait = _max_wait(index, groups)
+        try:
+            if len(group) == 1:
+                winner, (response, usage, started_at, shared) = 0, await _call_model_async(
+                    prompt, group[0][0], stream, max_wait)
+            else:
+                winner, (response, usage, started_at, shared) = await _hedged_async(
+                    lambda: _call_model_async(prompt, group[0][0], stream, max_wait),
+                    lambda: _call_model_async(prompt, group[1][0], stream, max_wait),
+                    _hedge_delay(group[0][0], hedge_delay)
+                )
+        except Exception as e:
+            if isinstance(e, RateLimitExceeded):
+                spilled.extend(model for model, _ in group)
+                ceiling = min(ceiling, _group_cost(group))
+            else:
+                failed.extend(model for model, _ in group)
+            error = e
+            continue
+        model, info = group[winner]
+        result = _after_call(prompt, model, info, prompt_embedding, cache, response, started_at, usage, shared,
+                             candidates)
+        _annotate(result, failed, group, winner, spilled, selected_model)
+        if not stream:
+            _log_request(prompt, candidates, result)
+        return result
+    _log_request(prompt, candidates, error=error)
+    raise error
+
+def _attempt_groups(candidates: List[tuple], fallback: bool, hedge: bool) -> List[List[tuple]]:
+    """Split the ranking into attempts: the first two race each other when hedging."""
+    attempts = candidates[:1 + MAX_FALLBACKS] if fallback else candidates[:1]
+    if hedge and len(attempts) > 1:
+        return [attempts[:2]] + [[candidate] for candidate in attempts[2:]]
+    return [[candidate] for candidate in attempts]
+
+def _group_cost(group: List[tuple]) -> float:
+    return max(info['cost'] for _, info in group)
+
+def _max_wait(index: int, groups: List[List[tuple]]) -> float:
+    """
+    Rate-limit wait budget for one attempt.
+    
+    Short (spill_wait) while a later candidate at most as expensive remains
+    to spill to; otherwise the request waits the full max_wait for this
+    model, since throttling must never push traffic onto a pricier one.
+    """
+    limiter = router.limiter
+    cost = _group_cost(groups[index])
+    if any(_group_cost(later) <= cost for later in groups[index + 1:]):
+        return limiter.spill_wait
+    return limiter.max_wait
+
+def _hedge_delay(model: str, hedge_delay: float = None) -> float:
+    if hedge_delay is not None:
+        return hedge_delay
+    observed = router.stats.latency_percentile(model, HEDGE_PERCENTILE)
+    return DEFAULT_HEDGE_DELAY if observed is None else observed
+
+def _hedged(primary, secondary, delay: float):
+    """
+    Run primary; start secondary too if primary fails or is still running after `delay`.
+    
+    Both are called with a threading.Event that is set once a winner is
+    known. Returns (index of the first successful call, its result).
+
+    A loser still queued, or still waiting for its rate limit, is never
+    sent. Unlike the async path, a loser already sent cannot be interrupted:
+    it holds a hedge thread and a pooled connection until the upstream
+    answers, and that answer (discarded here) is billed.
+    """
+    cancelled = threading.Event()
+    futures = [_hedge_pool.submit(primary, cancelled)]
+    done, _ = concurrent.futures.wait(futures, timeout=delay)
+    if not done or futures[0].exception() is not None:
+        logger.info("[HEDGE] Primary not done after %.2fs, sending runner-up", delay)
+        futures.append(_hedge_pool.submit(secondary, cancelled))
+    pending, error = set(futures), None
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                cancelled.set()
+                for other in pending:
+                    if not other.cancel():
+                        logger.info("[HEDGE] Losing request already sent; its answer will be discarded")
+                return futures.index(future), future.result()
+            error = future.exception()
+    raise error
+
+async def _hedged_async(primary, secondary, delay: float):
+    """Async _hedged(); the losing request is cancelled."""
+    tasks = [asyncio.ensure_future(primary())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done or tasks[0].exception() is not None:
+            logger.info("[HEDGE] Primary not done after %.2fs, sending runner-up", delay)
+            tasks.append(asyncio.ensure_future(secondary()))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return tasks.index(task), task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+def _annotate(result: Dict, failed: List[str], group: List[tuple], winner: int, spilled: List[str] = (),
+              selected_model: str = None):
+    """Record fallback, rate-limit spill-over and hedging details in routing_metadata."""
+    metadata = result["routing_metadata"]
+    if selected_model is not None and selected_model != result["model_used"]:
+        metadata["selected_model"] = selected_model
+    if spilled:
+        logger.info("[RATE LIMIT] %s throttled, spilled over to %s", ', '.join(spilled), result['model_used'])
+        metadata["spilled_from"] = list(spilled)
+    if failed:
+        logger.warning("[FALLBACK] %s failed, answered by %s", ', '.join(failed), result['model_used'])
+        metadata["fallback_from"] = failed
+    if len(group) > 1:
+        metadata["hedged"] = True
+        metadata["hedge_winner"] = "primary" if winner == 0 else "runner_up"
+
+def _call_model(prompt: str, model: str, stream: bool = False, max_wait: float = None,
+                cancelled: threading.Event = None) -> tuple:
+    """
+    One OpenRouter call; returns (response, usage, started_at, shared).
+    
+    Identical concurrent non-streamed calls are coalesced; `shared` is True
+    for callers that received another caller's response. A hedged call
+    (`cancelled` given) is not coalesced, so giving it up cannot fail
+    another caller.
+    """
+    if stream or cancelled is not None:
+        return _send(prompt, model, stream=stream, max_wait=max_wait, cancelled=cancelled) + (False,)
+    result, shared = call_flight.do((model, prompt), lambda: _send(prompt, model, max_wait=max_wait))
+    return result + (shared,)
+
+async def _call_model_async(prompt: str, model: str, stream: bool = False, max_wait: float = None) -> tuple:
+    """Async _call_model()."""
+    if stream:
+        return await _send_async(prompt, model, stream=True, max_wait=max_wait) + (False,)
+    result, shared = await async_call_flight.do((model, prompt), lambda: _send_async(prompt, model, max_wait=max_wait))
+    return result + (shared,)
+
+def _api_key_id():
+    return key_id(client.api_key or os.getenv('OPENROUTER_API_KEY'))
+
+def _send(prompt: str, model: str, stream: bool = False, max_wait: float = None,
+          cancelled: threading.Event = None) -> tuple:
+    """
+    Send one request; returns (response, usage, started_at) and records failures.
+    
+    Waits first for the model's and API key's rate limits, or raises
+    RateLimitExceeded (not counted as a model failure) if that would take
+    longer than `max_wait` seconds. Raises CancelledError instead of sending
+    if `cancelled` was set meanwhile (a hedge already has its answer).
+    """
+    tokens, key = estimate_tokens(prompt), _api_key_id()
+    with metrics.timer('admission'):
+        router.limiter.acquire(model, tokens, key, max_wait)
+    if cancelled is not None and cancelled.is_set():
+        router.limiter.settle(model, tokens, 0, key)
+        raise concurrent.futures.CancelledError()
+    _check_circuit(model, tokens, key)
+    started_at = time.perf_counter()
+    try:
+        if stream:
+            return StreamingResponse(client.stream_completion(prompt, model), {}, started_at,
+                                     on_error=lambda e: _record_failure(model, started_at, e)), None, started_at
+        response = client.post('chat/completions', {"model": model, "messages": _messages(prompt)})
+    except Exception as e:
+        _record_failure(model, started_at, e)
+        raise
+    return _parse_completion(model, response, started_at, tokens, key)
+
+def _check_circuit(model: str, tokens: int, key):
+    """Raise CircuitOpenError, returning the reserved tokens, unless the breaker admits a call to `model`."""
+    if not router.stats.admit(model):
+        router.limiter.settle(model, tokens, 0, key)
+        metrics.inc('upstream_requests', model=model, outcome='circuit_open')
+        raise CircuitOpenError(model)
+
+def _record_failure(model: str, started_at: float, error: Exception):
+    logger.warning("[ERROR] Failed to call OpenRouter (%s): %s", model, error)
+    metrics.inc('upstream_requests', model=model, outcome='error')
+    if _is_client_error(error):
+        # The request was rejected, not the model: its health is unchanged
+        router.stats.release_probe(model)
+    else:
+        router.stats.record_failure(model, time.perf_counter() - started_at)
+
+def _is_client_error(error: Exception) -> bool:
+    """True for 4xx responses caused by the request itself (bad payload, auth, unknown model)."""
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+def _parse_completion(model: str, response, started_at: float, tokens: int, key) -> tuple:
+    """Time the round trip and the JSON decode; returns (text, usage, started_at)."""
+    metrics.observe('stage_seconds', time.perf_counter() - started_at, stage='upstream')
+    try:
+        with metrics.timer('parse'):
+            completion = response.json()
+            text = completion['choices'][0]['message']['content']
+    except Exception as e:
+        # A 200 without a usable completion fails the model like a 5xx (and ends a half-open probe)
+        _record_failure(model, started_at, e)
+        raise
+    metrics.inc('upstream_requests', model=model, outcome='ok')
+    usage = completion.get('usage')
+    router.limiter.settle(model, tokens, (usage or {}).get('total_tokens'), key)
+    return text, usage, started_at
+
+async def _send_async(prompt: str, model: str, stream: bool = False, max_wait: float = None) -> tuple:
+    """Async _send() within the rate limits and the global and per-model concurrency limits."""
+    tokens, key = estimate_tokens(prompt), _api_key_id()
+    with metrics.timer('admission'):
+        await router.limiter.acquire_async(model, tokens, key, max_wait)
+    _check_circuit(model, tokens, key)
+    state = await _async_state()
+    model_limit = state["model_limits"].setdefault(model, asyncio.Semaphore(MAX_CONCURRENT_PER_MODEL))
+    started_at = time.perf_counter()
+    try:
+        if stream:
+            # The slots stay taken until the stream is consumed or closed
+            await state["limit"].acquire()
+            await model_limit.acquire()
+            release = lambda: (model_limit.release(), state["limit"].release())
+            try:
+                chunks = await state["client"].stream_completion(prompt, model)
+            except BaseException:
+                release()
+                raise
+            return AsyncStreamingResponse(chunks, {}, started_at,
+                                          on_error=lambda e: _record_failure(model, started_at, e),
+                                          on_close=release), None, started_at
+        async with state["limit"], model_limit:
+            response = await state["client"].post('chat/completions', {"model": model, "messages": _messages(prompt)})
+    except asyncio.CancelledError:
+        # A cancelled call (e.g. a losing hedge) says nothing about the model's health
+        router.stats.release_probe(model)
+        raise
     except Exception as e:
-        print(f"[ERROR] Failed to call OpenRouter: {e}")
+        _record_failure(model, started_at, e)
         raise
+    return _parse_completion(model, response, started_at, tokens, key)
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+def _before_call(prompt: str, selected_model: str, routing_info: Dict, prompt_embedding, use_cache: bool):
+    """Log the routing decision and check the response cache; returns (cache, cached result)."""
+    # Step 2: Log routing decision
+    logger.info("[ROUTING] Prompt: %s...", prompt[:50])
+    logger.info("[ROUTING] Selected Model: %s", selected_model)
+    logger.info("[ROUTING] Similarity: %.4f, Cost: %.2f, Stage: %s",
+                routing_info['similarity'], routing_info['cost'], routing_info.get('stage', 'embedding'))
+    metrics.inc('routed', model=selected_model, stage=routing_info.get('stage', 'embedding'))
+    
+    cache = response_cache if use_cache and prompt_embedding is not None else None
+    if cache is None:
+        return None, None
+    
+    # A near-duplicate prompt answered by the same model skips the API call
+    with metrics.timer('cache_lookup'):
+        cached = cache.lookup(selected_model, prompt_embedding)
+    if cached is None:
+        return cache, None
+    logger.info("[CACHE] Reusing response (similarity %.4f)", cached['similarity'])
+    result = _result(selected_model, routing_info, cached['response'], 0.0, cached=True)
+    result["routing_metadata"]["cache_similarity"] = cached['similarity']
+    return cache, result
+
+def _after_call(prompt: str, selected_model: str, routing_info: Dict, prompt_embedding,
+                cache, response, started_at: float, usage: Dict = None, shared: bool = False,
+                candidates: List[tuple] = None) -> Dict:
+    """Record live model stats and build the result dict; fresh responses go to the cache.
+    
+    For streams both happen once the caller has consumed the whole stream. A
+    response shared through request coalescing was already recorded by the
+    caller that made the request. A finished stream is written to the
+    request log here, with its full `candidates` ranking.
+    """
+    # Step 4: Cost from the response's token usage (a stream's cost is filled in once it is consumed);
+    # a coalesced response cost nothing extra, like a cache hit
+    result = _result(selected_model, routing_info, response, 0.0, cached=False)
+    metadata = result["routing_metadata"]
+    if shared:
+        metadata["coalesced"] = True
+    
+    def finish(text: str):
+        if shared:
+            return
+        prompt_tokens, completion_tokens, cost = _usage_cost(routing_info['cost'], usage, prompt, text)
+        result["estimated_cost"] = cost
+        metadata["prompt_tokens"] = prompt_tokens
+        metadata["completion_tokens"] = completion_tokens
+        metrics.observe('model_latency_seconds', metadata["generation_time"], model=selected_model)
+        metrics.inc('tokens', prompt_tokens, model=selected_model, kind='prompt')
+        metrics.inc('tokens', completion_tokens, model=selected_model, kind='completion')
+        metrics.inc('cost_usd', cost, model=selected_model)
+        router.stats.record_success(selected_model, metadata["generation_time"], completion_tokens)
+        if cache is not None:
+            cache.store(selected_model, prompt, prompt_embedding, text)
+        if isinstance(response, StreamingResponse):
+            _log_request(prompt, candidates, result)
+    
+    if isinstance(response, StreamingResponse):
+        # Timings, stats and the cache entry are filled in as the caller consumes the stream
+        response.metadata = metadata
+        response.on_complete = finish
+    else:
+        metadata["generation_time"] = time.perf_counter() - started_at
+        finish(response)
+    return result
+
+def _log_request(prompt: str, candidates: List[tuple], result: Dict = None, error: Exception = None):
+    log = request_log
+    if log is None or not candidates:
+        return
+    try:
+        log.record(prompt, candidates, result, error)
+    except Exception as e:
+        # The call already succeeded (and was billed); a logging failure must not fail the request
+        logger.warning("[REQUEST LOG] Could not write to %s: %s", log.path, e)
+
+def _usage_cost(price: float, usage: Dict, prompt: str, text: str) -> tuple:
+    """
+    (prompt tokens, completion tokens, USD) for one call.
+    
+    Uses the response's `usage` counts and `usage.cost` when present; token
+    counts missing from it (streams) are estimated from character counts and
+    priced at the model's llm_data cost per million tokens.
+    """
+    usage = usage or {}
+    prompt_tokens = usage.get('prompt_tokens')
+    if prompt_tokens is None:
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN + 1
+    completion_tokens = usage.get('completion_tokens')
+    if completion_tokens is None:
+        completion_tokens = len(text) // CHARS_PER_TOKEN + 1 if text else 0
+    cost = usage.get('cost')
+    if cost is None:
+        cost = (prompt_tokens + completion_tokens) * price / COST_PER_TOKENS
+    return prompt_tokens, completion_tokens, float(cost)
+
+def _result(selected_model: str, routing_info: Dict, response,
+            estimated_cost: float, cached: bool) -> Dict:
+    return {
+        "model_used": selected_model,
+        "response": response,
+        "estimated_cost": estimated_cost,
+        "cached": cached,
+        "routing_metadata": {
+            "similarity": routing_info['similarity'],
+            "model_cost": routing_info['cost'],
+            "routing_stage": routing_info.get('stage', 'embedding')
+        }
+    }
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    
     # Test the orchestrator
     test_prompt = "Explain transformers to a 10 year old"
     result = orchestrate(test_prompt)
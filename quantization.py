@@ -0,0 +1,51 @@
+"""Compressed embedding storage: float16 and per-vector scaled int8 quantization."""
+import numpy as np
+from typing import Optional, Tuple
+
+SUPPORTED_DTYPES = ('float32', 'float16', 'int8')
+
+
+def quantize(matrix, dtype: str = 'float32') -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Compress row vectors for storage.
+
+    Args:
+        matrix: Float row vectors (normally L2-normalized)
+        dtype: 'float32', 'float16' or 'int8'
+
+    Returns:
+        (data, scales): `scales` is None except for int8, where each row is
+        stored as round(row / scale) with scale = max(|row|) / 127
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported embedding dtype {dtype!r}, expected one of {SUPPORTED_DTYPES}")
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    if dtype != 'int8':
+        return np.ascontiguousarray(matrix, dtype=dtype), None
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    data = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return data, scales.astype(np.float32)
+
+
+def dequantize(data: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Float32 rows back from quantize() output."""
+    matrix = np.asarray(data).astype(np.float32, copy=False)
+    return matrix if scales is None else matrix * scales[:, None]
+
+
+def scores(queries: np.ndarray, data: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    queries @ rows.T against compressed rows.
+
+    Only the rows passed in are widened to float32, so callers scanning a
+    large matrix in blocks never hold a full-precision copy of it. The
+    int8 per-row scale is applied to the (much smaller) score matrix.
+    """
+    result = queries @ data.astype(np.float32, copy=False).T
+    return result if scales is None else result * scales
+
+
+def storage_bytes(data: np.ndarray, scales: Optional[np.ndarray] = None) -> int:
+    """Bytes used by a compressed matrix, including its scales."""
+    return int(data.nbytes + (0 if scales is None else scales.nbytes))
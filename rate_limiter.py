@@ -0,0 +1,257 @@
+"""Client-side admission control: token buckets per model and per API key with bounded, deadline-aware waiting."""
+import asyncio
+import hashlib
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Rough prompt size used until the response reports real usage
+CHARS_PER_TOKEN = 4
+# Completion tokens reserved per request; the difference is settled from `usage` afterwards
+EXPECTED_COMPLETION_TOKENS = 256
+
+
+class RateLimitExceeded(Exception):
+    """A request could not be admitted within its wait budget, or the wait queue was full."""
+
+    def __init__(self, model: str, reason: str, retry_after: float = 0.0):
+        super().__init__(f"rate limit for {model}: {reason}")
+        self.model = model
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` per second up to `capacity`.
+
+    Admitted requests take their amount immediately, even if that leaves
+    the level negative; the next request then waits for the debt to refill
+    as well, so waiters are served in reservation order. Not thread-safe on
+    its own; RateLimiter holds a lock around every call.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until `amount` (capped at the capacity) is available."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Take `amount` more (or give back a negative amount) after the fact."""
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """
+    Requests-per-second and tokens-per-minute limits per model and per API key.
+
+    Each request reserves one request and its estimated tokens from its
+    model's buckets and from its key's buckets, and learns how long to wait
+    before sending. If that wait is longer than the caller's `max_wait`, or
+    `max_queue` requests are already waiting, it is rejected at once with
+    RateLimitExceeded rather than queued only to miss its deadline, and it
+    takes nothing from the buckets. A limit left as None is not enforced.
+
+    Limits apply within one process; give each worker process its share.
+    """
+
+    def __init__(self, requests_per_second: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 key_requests_per_second: Optional[float] = None, key_tokens_per_minute: Optional[float] = None,
+                 model_limits: Optional[Dict[str, Dict]] = None, max_queue: int = 256,
+                 max_wait: float = 10.0, spill_wait: float = 0.25):
+        self.requests_per_second = requests_per_second
+        self.tokens_per_minute = tokens_per_minute
+        self.key_requests_per_second = key_requests_per_second
+        self.key_tokens_per_minute = key_tokens_per_minute
+        self.model_limits = model_limits or {}
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.spill_wait = spill_wait
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._counts = {}
+        self._waiting = 0
+        self.max_waiting = 0
+
+    @classmethod
+    def from_config(cls, limits: Optional[Dict]) -> 'RateLimiter':
+        """Build from the `optional.rate_limits` section of the router manifest."""
+        limits = limits or {}
+        return cls(
+            requests_per_second=limits.get('requests_per_second'),
+            tokens_per_minute=limits.get('tokens_per_minute'),
+            key_requests_per_second=limits.get('key_requests_per_second'),
+            key_tokens_per_minute=limits.get('key_tokens_per_minute'),
+            model_limits=limits.get('models'),
+            max_queue=limits.get('max_queue', 256),
+            max_wait=limits.get('max_wait_seconds', 10.0),
+            spill_wait=limits.get('spill_wait_seconds', 0.25)
+        )
+
+    def _pair(self, scope: str, name: str, rps: Optional[float], tpm: Optional[float]) -> Tuple:
+        pair = self._buckets.get((scope, name))
+        if pair is None:
+            pair = self._buckets[(scope, name)] = (
+                TokenBucket(rps) if rps else None,
+                TokenBucket(tpm / 60.0, tpm) if tpm else None
+            )
+        return pair
+
+    def _rates(self, scope: str, name: str) -> Tuple[Optional[float], Optional[float]]:
+        """(requests per second, tokens per minute) for one model or API key."""
+        if scope == 'model':
+            overrides = self.model_limits.get(name, {})
+            return (overrides.get('requests_per_second', self.requests_per_second),
+                    overrides.get('tokens_per_minute', self.tokens_per_minute))
+        return self.key_requests_per_second, self.key_tokens_per_minute
+
+    def _pairs(self, model: str, key: Optional[str]) -> List[Tuple]:
+        pairs = [self._pair('model', model, *self._rates('model', model))]
+        if key is not None:
+            pairs.append(self._pair('key', key, *self._rates('key', key)))
+        return pairs
+
+    def reconfigure(self, limits: Optional[Dict]):
+        """
+        Switch to the limits of a new `optional.rate_limits` section (e.g. after a router reload).
+
+        Buckets are rebuilt at the new rates but keep their current level
+        (capped at the new capacity), so a reload grants no fresh burst;
+        the admitted / delayed / rejected counts carry over.
+        """
+        new = RateLimiter.from_config(limits)
+        now = time.monotonic()
+        with self._lock:
+            for name in ('requests_per_second', 'tokens_per_minute', 'key_requests_per_second',
+                         'key_tokens_per_minute', 'model_limits', 'max_queue', 'max_wait', 'spill_wait'):
+                setattr(self, name, getattr(new, name))
+            buckets, self._buckets = self._buckets, {}
+            for (scope, name), (requests, token_bucket) in buckets.items():
+                rps, tpm = self._rates(scope, name)
+                self._buckets[(scope, name)] = (
+                    _carry_over(requests, TokenBucket(rps), now) if rps else None,
+                    _carry_over(token_bucket, TokenBucket(tpm / 60.0, tpm), now) if tpm else None
+                )
+
+    def _count(self, model: str) -> Dict[str, float]:
+        counts = self._counts.get(model)
+        if counts is None:
+            counts = self._counts[model] = {'admitted': 0, 'delayed': 0, 'rejected': 0, 'wait_seconds': 0.0}
+        return counts
+
+    def reserve(self, model: str, tokens: int = 0, key: Optional[str] = None,
+                max_wait: Optional[float] = None) -> float:
+        """
+        Reserve capacity for one request without sleeping.
+
+        Args:
+            model: OpenRouter model id
+            tokens: Estimated prompt plus completion tokens
+            key: API key the request is sent with (None to skip the key limits)
+            max_wait: Longest acceptable wait in seconds (defaults to `max_wait`)
+
+        Returns:
+            Seconds to wait before sending; call done_waiting() after a non-zero wait
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        now = time.monotonic()
+        with self._lock:
+            demands = []
+            for requests, token_bucket in self._pairs(model, key):
+                if requests is not None:
+                    demands.append((requests, 1))
+                if token_bucket is not None:
+                    demands.append((token_bucket, tokens))
+            delay = max([bucket.delay(amount, now) for bucket, amount in demands], default=0.0)
+            counts = self._count(model)
+            if delay > max_wait:
+                counts['rejected'] += 1
+                raise RateLimitExceeded(model, f"needs {delay:.2f}s, may wait {max_wait:.2f}s", delay)
+            if delay > 0 and self._waiting >= self.max_queue:
+                counts['rejected'] += 1
+                raise RateLimitExceeded(model, f"{self._waiting} requests already waiting", delay)
+            for bucket, amount in demands:
+                bucket.take(amount)
+            counts['admitted'] += 1
+            if delay > 0:
+                counts['delayed'] += 1
+                counts['wait_seconds'] += delay
+                self._waiting += 1
+                self.max_waiting = max(self.max_waiting, self._waiting)
+        return delay
+
+    def done_waiting(self):
+        with self._lock:
+            self._waiting -= 1
+
+    def acquire(self, model: str, tokens: int = 0, key: Optional[str] = None,
+                max_wait: Optional[float] = None):
+        """Block until the request may be sent; raises RateLimitExceeded instead of waiting too long."""
+        delay = self.reserve(model, tokens, key, max_wait)
+        if delay > 0:
+            try:
+                time.sleep(delay)
+            finally:
+                self.done_waiting()
+
+    async def acquire_async(self, model: str, tokens: int = 0, key: Optional[str] = None,
+                            max_wait: Optional[float] = None):
+        """asyncio acquire()."""
+        delay = self.reserve(model, tokens, key, max_wait)
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self.done_waiting()
+
+    def settle(self, model: str, estimated: int, actual: Optional[int], key: Optional[str] = None):
+        """Correct the token buckets once the response reports how many tokens were really used."""
+        if actual is None:
+            return
+        with self._lock:
+            for _, token_bucket in self._pairs(model, key):
+                if token_bucket is not None:
+                    token_bucket.adjust(actual - estimated)
+
+    def stats(self) -> Dict:
+        """Admitted / delayed / rejected counts per model and the current wait queue length."""
+        with self._lock:
+            return {
+                'waiting': self._waiting,
+                'max_waiting': self.max_waiting,
+                'models': {model: dict(counts) for model, counts in self._counts.items()}
+            }
+
+
+def _carry_over(old: Optional[TokenBucket], new: TokenBucket, now: float) -> TokenBucket:
+    if old is not None:
+        old._refill(now)
+        new.level = min(new.capacity, old.level)
+        new.updated = now
+    return new
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Tokens to reserve for a request: a character-based prompt estimate plus EXPECTED_COMPLETION_TOKENS."""
+    return len(prompt) // CHARS_PER_TOKEN + 1 + EXPECTED_COMPLETION_TOKENS
+
+
+def key_id(api_key: Optional[str]) -> Optional[str]:
+    """Short digest identifying an API key, so the key itself is not kept in the limiter."""
+    if not api_key:
+        return None
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
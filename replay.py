@@ -0,0 +1,224 @@
+"""Replay a request log (see request_log.py) through the router or the full orchestrator.
+
+    python replay.py requests.jsonl --mode routing --speed 10
+    python replay.py requests.jsonl --mode upstream --speed 0 --concurrency 64 --output replay.json
+
+Records are read lazily and dispatched at their recorded inter-arrival
+times divided by --speed (0 = as fast as possible). Latency is measured from
+each request's scheduled time, so queueing behind a slow router shows up
+instead of being hidden. The report compares the router's decisions with the
+ones in the log (drift) and summarizes latency and throughput.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import threading
+import time
+import numpy as np
+from collections import Counter
+from typing import Dict, Iterator, Optional
+
+from benchmark import summarize
+from mock_openrouter import MockOpenRouter
+from request_log import read_request_log
+
+MODES = ('routing', 'upstream')
+
+
+def paced(records: Iterator[Dict], speed: float) -> Iterator[tuple]:
+    """(record, scheduled perf_counter time) pairs, sleeping until each one is due."""
+    start, first_ts = time.perf_counter(), None
+    for record in records:
+        if speed <= 0 or 'ts' not in record:
+            yield record, time.perf_counter()
+            continue
+        if first_ts is None:
+            first_ts = record['ts']
+        due = start + (record['ts'] - first_ts) / speed
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield record, due
+
+
+def placeholder_prompt(record: Dict, sequence: int) -> str:
+    """
+    Stand-in for a prompt logged without its text: the same length, salted
+    with the prompt's hash (or the record's sequence number) so distinct
+    prompts do not collapse into one cached or coalesced request.
+    """
+    length = max(1, record.get('prompt_chars', 1))
+    salt = f"{record.get('prompt_sha256') or sequence} "
+    return (salt * (length // len(salt) + 1))[:length]
+
+
+class Replay:
+    """
+    Drives one replay and accumulates its results.
+
+    In 'routing' mode each logged prompt is ranked by a Router built from
+    `config` (no upstream calls). In 'upstream' mode it goes through
+    orchestrator.orchestrate(), whose OpenRouter client must already point
+    at the mock or a staging endpoint; the orchestrator's router is
+    replaced if `config` names a different manifest. Records logged
+    without prompt text are routed from a placeholder_prompt() in upstream
+    mode, to keep the load shape, and are left out of the drift comparison.
+    """
+
+    def __init__(self, mode: str, config: str = 'knn_router.yaml', concurrency: int = 1,
+                 rate_limits: bool = True):
+        self.mode = mode
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.service_times = []
+        self.errors = 0
+        self.skipped = 0
+        self.compared = 0
+        self.changed = 0
+        self.transitions = Counter()
+        self.score_deltas = []
+        from router import Router
+        if mode == 'routing':
+            self.router = Router(config)
+            self.router.warmup()
+        else:
+            import orchestrator
+            from rate_limiter import RateLimiter
+            if os.path.abspath(config) != os.path.abspath(orchestrator.router.config_path):
+                orchestrator.router = Router(config, embedding_cache=orchestrator.embedding_cache)
+            if not rate_limits:
+                orchestrator.router.limiter = RateLimiter()
+            self.orchestrator = orchestrator
+            orchestrator.warmup()
+
+    def run(self, records: Iterator[Dict], speed: float = 1.0, limit: Optional[int] = None) -> Dict:
+        replayed = 0
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = set()
+            for record, scheduled in paced(records, speed):
+                if limit is not None and replayed >= limit:
+                    break
+                if self.mode == 'routing' and 'prompt' not in record:
+                    self.skipped += 1
+                    continue
+                pending.add(pool.submit(self._one, record, scheduled, replayed))
+                replayed += 1
+                # Keep the backlog bounded without blocking on every submit
+                if len(pending) >= self.concurrency * 4:
+                    _, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            concurrent.futures.wait(pending)
+        elapsed = time.perf_counter() - start
+        return self.report(replayed, elapsed, speed)
+
+    def _one(self, record: Dict, scheduled: float, sequence: int = 0):
+        prompt = record.get('prompt') or placeholder_prompt(record, sequence)
+        started = time.perf_counter()
+        try:
+            if self.mode == 'routing':
+                candidates = self.router.rank_prompt(prompt)
+                selected, scores = candidates[0][0], {model: info['combined_score'] for model, info in candidates}
+            else:
+                result = self.orchestrator.orchestrate(prompt)
+                metadata = result["routing_metadata"]
+                selected, scores = metadata.get('selected_model', result["model_used"]), None
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            return
+        finished = time.perf_counter()
+        with self._lock:
+            self.latencies.append(finished - scheduled)
+            self.service_times.append(finished - started)
+            if 'prompt' in record and 'selected' in record:
+                self.compared += 1
+                if selected != record['selected']:
+                    self.changed += 1
+                    self.transitions[f"{record['selected']} -> {selected}"] += 1
+                if scores is not None and selected in record.get('scores', {}):
+                    self.score_deltas.append(abs(scores[selected] - record['scores'][selected]))
+
+    def report(self, replayed: int, elapsed: float, speed: float) -> Dict:
+        report = {
+            'mode': self.mode,
+            'speed': speed,
+            'concurrency': self.concurrency,
+            'replayed': replayed,
+            'skipped_without_prompt': self.skipped,
+            'errors': self.errors,
+            'latency': summarize(self.latencies, elapsed),
+            'service_ms': summarize(self.service_times, elapsed),
+            'drift': {
+                'compared': self.compared,
+                'changed': self.changed,
+                'rate': self.changed / self.compared if self.compared else None,
+                'transitions': dict(self.transitions.most_common()),
+                'mean_abs_score_delta': float(np.mean(self.score_deltas)) if self.score_deltas else None
+            }
+        }
+        if self.mode == 'routing':
+            report['stages'] = dict(self.router.stage_counts)
+        return report
+
+
+def recorded_latency(path: str, limit: Optional[int] = None) -> Dict:
+    """Latency percentiles (ms) of the upstream calls as recorded in the log."""
+    latencies = []
+    for i, record in enumerate(read_request_log(path)):
+        if limit is not None and i >= limit:
+            break
+        if record.get('latency') is not None and not record.get('cached'):
+            latencies.append(record['latency'])
+    if not latencies:
+        return {}
+    latencies = np.asarray(latencies) * 1000.0
+    return {
+        'count': len(latencies),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99))
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay a request log through the router')
+    parser.add_argument('log', help='request log written by orchestrator.enable_request_log()')
+    parser.add_argument('--mode', choices=MODES, default='routing')
+    parser.add_argument('--config', default='knn_router.yaml', help='router manifest to test')
+    parser.add_argument('--speed', type=float, default=1.0, help='pace multiplier; 0 replays as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--limit', type=int, help='replay at most this many records')
+    parser.add_argument('--base-url', help='upstream to call in upstream mode instead of the bundled mock')
+    parser.add_argument('--mock-latency-ms', type=float,
+                        help='mock upstream latency (default: median recorded latency, else 50)')
+    parser.add_argument('--mock-error-rate', type=float, default=0.0)
+    parser.add_argument('--no-rate-limits', action='store_true', help='lift the client-side rate limits')
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    args = parser.parse_args()
+
+    recorded = recorded_latency(args.log, args.limit)
+    mock = None
+    if args.mode == 'upstream':
+        base_url = args.base_url
+        if base_url is None:
+            latency_ms = args.mock_latency_ms if args.mock_latency_ms is not None else recorded.get('p50_ms', 50.0)
+            mock = MockOpenRouter(latency=latency_ms / 1000.0, error_rate=args.mock_error_rate).start()
+            base_url = mock.base_url
+        # Set before orchestrator is imported; its client reads these once
+        os.environ['OPENROUTER_BASE_URL'] = base_url
+        os.environ.setdefault('OPENROUTER_API_KEY', 'mock-key')
+
+    replay = Replay(args.mode, args.config, args.concurrency, rate_limits=not args.no_rate_limits)
+    report = replay.run(read_request_log(args.log), args.speed, args.limit)
+    report['recorded_latency'] = recorded
+    if mock is not None:
+        report['mock'] = dict(mock.counts)
+        mock.stop()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
@@ -0,0 +1,89 @@
+"""Opt-in JSONL log of orchestrated requests, read back by replay.py."""
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+DEFAULT_REQUEST_LOG = 'requests.jsonl'
+
+# Result metadata copied into a record when present
+METADATA_FIELDS = ('fallback_from', 'spilled_from', 'hedged', 'coalesced', 'cache_similarity')
+
+
+class RequestLog:
+    """
+    Appends one compact JSON line per orchestrated request.
+
+    A record holds the prompt's sha256 prefix and length, the routing
+    stage, every candidate's combined score, the selected and answering
+    models, latency, token usage and cost. The prompt text itself is only
+    kept with `include_prompts=True`; replay.py needs it to re-route.
+    Lines are written under a lock and flushed one by one, so concurrent
+    requests never interleave and the file can be tailed.
+    """
+
+    def __init__(self, path: str = DEFAULT_REQUEST_LOG, include_prompts: bool = False):
+        self.path = path
+        self.include_prompts = include_prompts
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8', buffering=1)
+        self.records = 0
+        self.dropped = 0
+
+    def record(self, prompt: str, candidates: List[tuple], result: Optional[Dict] = None,
+               error: Optional[Exception] = None):
+        """Append one request: its ranked candidates and either the result dict or the error."""
+        metadata = result["routing_metadata"] if result is not None else {}
+        entry = {
+            'ts': round(time.time(), 3),
+            'prompt_sha256': prompt_hash(prompt),
+            'prompt_chars': len(prompt),
+            'stage': candidates[0][1].get('stage', 'embedding'),
+            'selected': candidates[0][0],
+            'model': result["model_used"] if result is not None else None,
+            'scores': {model: round(info['combined_score'], 6) for model, info in candidates},
+            'latency': metadata.get('generation_time'),
+            'prompt_tokens': metadata.get('prompt_tokens'),
+            'completion_tokens': metadata.get('completion_tokens'),
+            'cost': result["estimated_cost"] if result is not None else None,
+            'cached': result["cached"] if result is not None else None
+        }
+        for field in METADATA_FIELDS:
+            if field in metadata:
+                entry[field] = metadata[field]
+        if error is not None:
+            entry['error'] = str(error)
+        if self.include_prompts:
+            entry['prompt'] = prompt
+        line = json.dumps({key: value for key, value in entry.items() if value is not None},
+                          separators=(',', ':')) + '\n'
+        with self._lock:
+            # Requests still finishing after close() (e.g. disable_request_log()) are dropped
+            if self._file.closed:
+                self.dropped += 1
+                return
+            self._file.write(line)
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def prompt_hash(prompt: str) -> str:
+    """First 16 hex digits of the prompt's sha256: enough to match prompts, not to recover them."""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+
+
+def read_request_log(path: str) -> Iterator[Dict]:
+    """Records of a request log in file order, read lazily; blank and truncated lines are skipped."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
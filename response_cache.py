@@ -0,0 +1,92 @@
+"""Semantic response cache: reuse a stored answer for a near-duplicate prompt."""
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class SemanticResponseCache:
+    """
+    Per-model store of (prompt embedding, response) pairs.
+
+    A lookup returns the stored response whose prompt embedding has the
+    highest cosine similarity to the query, if it reaches `threshold`, was
+    produced by the same model and is younger than `ttl` seconds. Past
+    `max_entries` the least recently used entry is evicted.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600.0, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._matrices = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, model: str, prompt_embedding) -> Optional[Dict]:
+        """Best matching live entry for this model, or None."""
+        query = _normalize(prompt_embedding)
+        with self._lock:
+            self._expire()
+            ids, matrix = self._matrix(model)
+            if not ids:
+                self.misses += 1
+                return None
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            entry = self._entries[ids[best]]
+            self._entries.move_to_end(ids[best])
+            self.hits += 1
+            return dict(entry, similarity=float(similarities[best]))
+
+    def store(self, model: str, prompt: str, prompt_embedding, response: str):
+        """Remember the response a model gave for a prompt."""
+        with self._lock:
+            self._entries[self._next_id] = {
+                'model': model,
+                'prompt': prompt,
+                'embedding': _normalize(prompt_embedding),
+                'response': response,
+                'created_at': time.time()
+            }
+            self._next_id += 1
+            self._matrices.pop(model, None)
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._matrices.pop(evicted['model'], None)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        expired = [key for key, entry in self._entries.items() if entry['created_at'] < cutoff]
+        for key in expired:
+            self._matrices.pop(self._entries.pop(key)['model'], None)
+
+    def _matrix(self, model: str):
+        """Stacked embeddings for one model, rebuilt only after that model's entries change."""
+        if model not in self._matrices:
+            ids = [key for key, entry in self._entries.items() if entry['model'] == model]
+            matrix = np.stack([self._entries[key]['embedding'] for key in ids]) if ids else None
+            self._matrices[model] = (ids, matrix)
+        return self._matrices[model]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+def _normalize(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,707 @@
+"""Vectorized KNN routing engine shared by the orchestrator and the test scripts."""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import numpy as np
+import yaml
+from typing import Dict, List, Optional, Tuple
+
+from atomic_io import atomic_write
+from encoders import Encoder, HashingEncoder, SentenceTransformerEncoder
+from knn_index import ExemplarIndex
+from model_stats import ModelStats
+from quantization import dequantize, quantize, scores as compressed_scores, storage_bytes
+from rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Default weights (overridden by `hparam` in knn_router.yaml): 70% similarity, 30% cost preference
+SIMILARITY_WEIGHT = 0.7
+COST_WEIGHT = 0.3
+# Live latency penalty: weight * latency / (latency + scale), scale in seconds
+LATENCY_WEIGHT = 0.0
+LATENCY_SCALE = 5.0
+# Subtracted from models whose circuit breaker is open, enough to drop below any healthy model
+OPEN_CIRCUIT_PENALTY = 10.0
+
+DEFAULT_CONFIG_PATH = 'knn_router.yaml'
+# Exemplar counts at which generate_config.py switches to an IVF index (and its list count)
+IVF_MIN_EXEMPLARS = 20000
+# Below this many exemplars, routing keeps scoring against model descriptions instead of k-NN voting
+MIN_EXEMPLARS = 50
+IVF_EXEMPLARS_PER_LIST = 256
+DEFAULT_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+
+def matrix_sha256(matrix: np.ndarray, scales: np.ndarray = None) -> str:
+    """Content hash of a stored embedding matrix (and int8 scales), used to detect a stale artifact."""
+    digest = hashlib.sha256(np.ascontiguousarray(matrix).tobytes())
+    if scales is not None:
+        digest.update(np.ascontiguousarray(scales, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def load_config(path: str = DEFAULT_CONFIG_PATH) -> Dict:
+    """Read the router manifest (knn_router.yaml)."""
+    with open(path, 'r') as f:
+        return yaml.safe_load(f)
+
+
+def load_embedding_matrix(config: Dict, base_dir: str = '.') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Memory-map the embedding matrix referenced by the manifest and verify it.
+    
+    Returns:
+        (matrix, scales) where scales is None unless the matrix is int8
+    """
+    spec = config['embeddings']
+    matrix = np.load(os.path.join(base_dir, spec['file']), mmap_mode='r')
+    scales = np.load(os.path.join(base_dir, spec['scales']), mmap_mode='r') if spec.get('scales') else None
+    if list(matrix.shape) != list(spec['shape']) or matrix.dtype != np.dtype(spec['dtype']):
+        raise ValueError(
+            f"Embedding matrix {spec['file']} has shape {matrix.shape} / {matrix.dtype}, "
+            f"manifest expects {spec['shape']} / {spec['dtype']}. Re-run generate_config.py."
+        )
+    if matrix_sha256(matrix, scales) != spec['sha256']:
+        raise ValueError(
+            f"Embedding matrix {spec['file']} does not match the manifest hash (stale artifact). "
+            "Re-run generate_config.py."
+        )
+    return matrix, scales
+
+
+def load_exemplar_index(config: Dict, base_dir: str = '.') -> ExemplarIndex:
+    """Load (memory-mapped) the exemplar index referenced by the manifest and verify it."""
+    spec = config['exemplars']
+    index = ExemplarIndex.load(os.path.join(base_dir, spec['file']))
+    if len(index) != spec['count'] or matrix_sha256(index.embeddings, index.scales) != spec['sha256']:
+        raise ValueError(
+            f"Exemplar index {spec['file']} does not match the manifest (stale artifact). "
+            "Re-run generate_config.py."
+        )
+    return index
+
+
+def load_lexical_stage(config: Dict, base_dir: str = '.') -> Tuple[HashingEncoder, np.ndarray]:
+    """Encoder and per-model centroids of the lexical first routing stage, verified against the manifest."""
+    spec = config['lexical']
+    centroids = np.load(os.path.join(base_dir, spec['file']), mmap_mode='r')
+    if matrix_sha256(centroids) != spec['sha256']:
+        raise ValueError(
+            f"Lexical centroids {spec['file']} do not match the manifest hash (stale artifact). "
+            "Re-run generate_config.py."
+        )
+    return HashingEncoder.from_spec(spec), centroids
+
+
+def write_router_artifact(config: Dict, embeddings, config_path: str = DEFAULT_CONFIG_PATH,
+                          exemplars: ExemplarIndex = None, dtype: str = 'float32',
+                          lexical_encoder: HashingEncoder = None, lexical_centroids=None) -> Dict:
+    """
+    Write the router as a YAML manifest plus a normalized .npy embedding matrix.
+    
+    Data files are content-addressed (<name>.<hash>.npy) and every file is
+    written to a temporary name and renamed into place, the manifest last.
+    A reader therefore sees either the old router or the new one, never a
+    mix. Data files used by neither manifest are removed afterwards.
+    
+    Args:
+        config: Router config whose `llm_data` entries are in matrix row order
+        embeddings: One embedding per `llm_data` entry
+        config_path: Where to write the manifest; the matrix goes next to it
+        exemplars: Optional exemplar index, saved next to the manifest as well
+        dtype: Storage type of the model matrix: 'float32', 'float16' or 'int8'
+               (int8 also writes per-row scales to <name>_scales.<hash>.npy)
+        lexical_encoder: Hashing encoder of the cheap first routing stage
+        lexical_centroids: Its per-model centroid vectors, in `llm_data` order
+        
+    Returns:
+        The manifest that was written
+    """
+    matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix, scales = quantize(matrix / norms, dtype)
+    
+    base_dir = os.path.dirname(config_path) or '.'
+    stem = os.path.splitext(os.path.basename(config_path))[0]
+    previous = load_config(config_path) if os.path.exists(config_path) else {}
+    
+    manifest = dict(config)
+    manifest['llm_data'] = {}
+    for row, (name, data) in enumerate(config['llm_data'].items()):
+        entry = {key: value for key, value in data.items() if key != 'embedding'}
+        entry['embedding_row'] = row
+        manifest['llm_data'][name] = entry
+    digest = matrix_sha256(matrix, scales)
+    manifest['embeddings'] = {
+        'file': _save_array(base_dir, stem, digest, matrix),
+        'dtype': dtype,
+        'shape': list(matrix.shape),
+        'normalized': True,
+        'sha256': digest
+    }
+    if scales is not None:
+        manifest['embeddings']['scales'] = _save_array(base_dir, stem + '_scales', digest, scales)
+    if exemplars is not None:
+        exemplar_file = f"{stem}_exemplars.{exemplars.content_sha256()[:16]}.npy"
+        if not os.path.exists(os.path.join(base_dir, exemplar_file + '.meta.npz')):
+            exemplars.save(os.path.join(base_dir, exemplar_file))
+        manifest['exemplars'] = {
+            'file': exemplar_file,
+            'dtype': exemplars.dtype,
+            'count': len(exemplars),
+            'n_lists': 0 if exemplars.centroids is None else len(exemplars.centroids),
+            'nprobe': exemplars.nprobe,
+            'sha256': matrix_sha256(exemplars.embeddings, exemplars.scales)
+        }
+    if lexical_centroids is not None:
+        centroids = np.ascontiguousarray(lexical_centroids, dtype=np.float32)
+        lexical_digest = matrix_sha256(centroids)
+        manifest['lexical'] = {
+            'file': _save_array(base_dir, stem + '_lexical', lexical_digest, centroids),
+            **lexical_encoder.spec(),
+            'sha256': lexical_digest
+        }
+    with atomic_write(config_path, 'w') as f:
+        yaml.dump(manifest, f, default_flow_style=False, sort_keys=False)
+    _remove_stale_artifacts(base_dir, stem, _artifact_files(manifest) | _artifact_files(previous))
+    return manifest
+
+
+def _save_array(base_dir: str, name: str, digest: str, array: np.ndarray) -> str:
+    """Save under the content-addressed name <name>.<hash>.npy (skipped if it exists); returns the file name."""
+    file_name = f"{name}.{digest[:16]}.npy"
+    path = os.path.join(base_dir, file_name)
+    if not os.path.exists(path):
+        with atomic_write(path) as f:
+            np.save(f, array)
+    return file_name
+
+
+def _artifact_files(manifest: Dict) -> set:
+    """Data files a manifest refers to."""
+    files = set()
+    for section, keys in (('embeddings', ('file', 'scales')), ('exemplars', ('file',)), ('lexical', ('file',))):
+        for key in keys:
+            if (manifest.get(section) or {}).get(key):
+                files.add(manifest[section][key])
+    if manifest.get('exemplars'):
+        files.add(manifest['exemplars']['file'] + '.meta.npz')
+    return files
+
+
+def _remove_stale_artifacts(base_dir: str, stem: str, keep: set):
+    """Delete earlier content-addressed data files of this router that are no longer referenced."""
+    pattern = re.compile(rf"^{re.escape(stem)}(_scales|_exemplars|_lexical)?\.[0-9a-f]{{16}}\.npy(\.meta\.npz)?$")
+    for file_name in os.listdir(base_dir):
+        if pattern.match(file_name) and file_name not in keep:
+            os.remove(os.path.join(base_dir, file_name))
+
+
+class RoutingTable:
+    """
+    Model embeddings stacked into one L2-normalized matrix with aligned cost arrays.
+    
+    With an exemplar index of at least `min_exemplars` entries the
+    similarity term is the k-NN vote of the `n_neighbors` nearest labeled
+    exemplars instead of the similarity to each model's description. The
+    matrix may be stored as float16 or int8 (with per-row `scales`); scores
+    are computed on it as stored.
+    
+    An optional lexical stage scores hashed n-gram vectors against per-model
+    centroids instead; its entries are marked 'stage': 'lexical'.
+    """
+
+    def __init__(self, models: List[str], embeddings, costs, max_tokens, normalized: bool = False,
+                 hparam: Dict = None, exemplars: ExemplarIndex = None, scales: np.ndarray = None,
+                 lexical_encoder: HashingEncoder = None, lexical_centroids: np.ndarray = None):
+        hparam = hparam or {}
+        self.n_neighbors = hparam.get('n_neighbors', 1)
+        self.min_exemplars = hparam.get('min_exemplars', MIN_EXEMPLARS)
+        # Lexical decisions stand when the top two combined scores differ by at least this much
+        self.cascade_margin = hparam.get('cascade_margin')
+        self.exemplars = exemplars
+        self.lexical_encoder = lexical_encoder
+        self.lexical_centroids = lexical_centroids
+        self.similarity_weight = hparam.get('similarity_weight', SIMILARITY_WEIGHT)
+        self.cost_weight = hparam.get('cost_weight', COST_WEIGHT)
+        self.latency_weight = hparam.get('latency_weight', LATENCY_WEIGHT)
+        self.latency_scale = hparam.get('latency_scale', LATENCY_SCALE)
+        self.open_circuit_penalty = hparam.get('open_circuit_penalty', OPEN_CIRCUIT_PENALTY)
+        self.models = list(models)
+        matrix = np.asarray(embeddings)
+        if not normalized:
+            matrix = dequantize(matrix, scales)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix, scales = matrix / norms, None
+        elif matrix.dtype not in (np.float16, np.int8):
+            matrix = matrix.astype(np.float32, copy=False)
+        # A memory-mapped artifact is already normalized and is used without copying
+        self.matrix = matrix
+        self.scales = scales
+        self.costs = np.asarray(costs, dtype=np.float64)
+        self.max_tokens = np.asarray(max_tokens, dtype=np.int64)
+        # Cost term does not depend on the prompt, so it is folded in once
+        self.cost_scores = (self.cost_weight * (1.0 - self.costs)).astype(np.float32)
+
+    @classmethod
+    def from_config(cls, config: Dict, base_dir: str = '.') -> 'RoutingTable':
+        """Build the table from a router manifest (or a legacy config with inline embeddings)."""
+        models, costs, max_tokens, rows = [], [], [], []
+        for data in config['llm_data'].values():
+            models.append(data['model'])
+            costs.append(data['cost'])
+            max_tokens.append(data['max_tokens'])
+            rows.append(data.get('embedding_row'))
+        
+        hparam = config.get('hparam', {})
+        exemplars = load_exemplar_index(config, base_dir) if 'exemplars' in config else None
+        lexical_encoder, lexical_centroids = (
+            load_lexical_stage(config, base_dir) if 'lexical' in config else (None, None)
+        )
+        if 'embeddings' not in config:
+            embeddings = [data['embedding'] for data in config['llm_data'].values()]
+            return cls(models, embeddings, costs, max_tokens, hparam=hparam, exemplars=exemplars,
+                       lexical_encoder=lexical_encoder, lexical_centroids=lexical_centroids)
+        
+        matrix, scales = load_embedding_matrix(config, base_dir)
+        if rows != list(range(len(rows))):
+            matrix = matrix[rows]
+            scales = None if scales is None else scales[rows]
+        return cls(models, matrix, costs, max_tokens,
+                   normalized=config['embeddings'].get('normalized', False), hparam=hparam,
+                   exemplars=exemplars, scales=scales,
+                   lexical_encoder=lexical_encoder, lexical_centroids=lexical_centroids)
+
+    @classmethod
+    def load(cls, config_path: str = DEFAULT_CONFIG_PATH) -> 'RoutingTable':
+        """Load the routing table from a manifest file on disk."""
+        return cls.from_config(load_config(config_path), os.path.dirname(config_path) or '.')
+
+    def astype(self, dtype: str) -> 'RoutingTable':
+        """Copy of the table with its matrix and exemplar index stored as `dtype`."""
+        table = RoutingTable.__new__(RoutingTable)
+        table.__dict__.update(self.__dict__)
+        table.matrix, table.scales = quantize(dequantize(self.matrix, self.scales), dtype)
+        if self.exemplars is not None:
+            table.exemplars = self.exemplars.astype(dtype)
+        return table
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the model matrix and the exemplar index."""
+        total = storage_bytes(self.matrix, self.scales)
+        return total + (self.exemplars.nbytes if self.exemplars is not None else 0)
+
+    def live_adjustments(self, stats) -> np.ndarray:
+        """Per-model score offsets from live ModelStats: latency penalty and open-circuit demotion."""
+        latencies = np.nan_to_num(stats.latencies(self.models), nan=0.0)
+        adjustments = -self.latency_weight * latencies / (latencies + self.latency_scale)
+        adjustments[stats.open_circuits(self.models)] -= self.open_circuit_penalty
+        return adjustments.astype(np.float32)
+
+    @property
+    def uses_exemplars(self) -> bool:
+        """True once the exemplar index is large enough to replace description similarity."""
+        return self.exemplars is not None and len(self.exemplars) >= max(self.min_exemplars, 1)
+
+    def with_exemplars(self, exemplars: ExemplarIndex) -> 'RoutingTable':
+        """Copy of the table (sharing its matrices) with a different exemplar index."""
+        table = RoutingTable.__new__(RoutingTable)
+        table.__dict__.update(self.__dict__)
+        table.exemplars = exemplars
+        return table
+
+    @property
+    def has_lexical_stage(self) -> bool:
+        return self.lexical_centroids is not None and self.cascade_margin is not None
+
+    def score(self, prompt_embeddings, adjustments: np.ndarray = None,
+              lexical: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return (similarity, combined_score) arrays of shape (n_prompts, n_models).
+        
+        `adjustments` is an optional per-model offset added to every row.
+        With lexical=True the rows are lexical-encoder vectors scored
+        against the lexical centroids.
+        """
+        queries = np.atleast_2d(np.asarray(prompt_embeddings, dtype=np.float32))
+        if lexical:
+            similarities = queries @ self.lexical_centroids.T
+        elif self.uses_exemplars:
+            similarities = self.exemplars.vote(queries, self.n_neighbors, self.models)
+        else:
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            similarities = compressed_scores(queries / norms, self.matrix, self.scales)
+        combined = self.similarity_weight * similarities + self.cost_scores
+        if adjustments is not None:
+            combined = combined + adjustments
+        return similarities, combined
+
+    def route(self, prompt_embedding, adjustments: np.ndarray = None,
+              lexical: bool = False) -> Tuple[str, Dict[str, Dict]]:
+        """Pick the best model for one embedding; also return the scores for every model."""
+        similarities, combined = self.score(prompt_embedding, adjustments, lexical)
+        best = int(np.argmax(combined[0]))
+        return self.models[best], self.describe(similarities[0], combined[0], lexical)
+
+    def route_batch(self, prompt_embeddings, adjustments: np.ndarray = None,
+                    lexical: bool = False) -> List[Tuple[str, Dict[str, Dict]]]:
+        """Route a whole batch of embeddings from a single matrix product."""
+        similarities, combined = self.score(prompt_embeddings, adjustments, lexical)
+        best = np.argmax(combined, axis=1)
+        return [
+            (self.models[int(best[row])], self.describe(similarities[row], combined[row], lexical))
+            for row in range(len(best))
+        ]
+
+    def rank_batch(self, prompt_embeddings, adjustments: np.ndarray = None,
+                   lexical: bool = False) -> List[List[Tuple[str, Dict]]]:
+        """Every model for every prompt, best first, as (model, scores) pairs."""
+        similarities, combined = self.score(prompt_embeddings, adjustments, lexical)
+        order = np.argsort(-combined, axis=1, kind='stable')
+        return [
+            [(self.models[i], self._entry(i, similarities[row], combined[row], lexical)) for i in order[row]]
+            for row in range(len(order))
+        ]
+
+    def _entry(self, i: int, similarities: np.ndarray, combined: np.ndarray, lexical: bool = False) -> Dict:
+        return {
+            'similarity': float(similarities[i]),
+            'cost': float(self.costs[i]),
+            'combined_score': float(combined[i]),
+            'stage': 'lexical' if lexical else 'embedding'
+        }
+
+    def describe(self, similarities: np.ndarray, combined: np.ndarray, lexical: bool = False) -> Dict[str, Dict]:
+        """Turn one row of scores into the per-model dict the scripts print."""
+        return {model: self._entry(i, similarities, combined, lexical) for i, model in enumerate(self.models)}
+
+
+def _file_version(path: str) -> Tuple[int, int, int]:
+    """Changes whenever the file is rewritten or replaced (os.replace gives it a new inode)."""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class RouterSnapshot:
+    """
+    Router state loaded from one version of the manifest: the config and the
+    routing table built from it.
+    
+    A snapshot is never modified by a reload; Router.reload() builds a new
+    one and swaps the reference, so a request that took a snapshot keeps a
+    complete, consistent table for as long as it holds it.
+    """
+
+    def __init__(self, config: Dict, table: RoutingTable, version: Tuple[int, int, int]):
+        self.config = config
+        self.table = table
+        self.version = version
+        self.loaded_at = time.time()
+
+
+def _breaker_settings(optional: Dict) -> Dict:
+    """ModelStats arguments from the manifest's `optional.circuit_breaker` section."""
+    breaker = optional.get('circuit_breaker', {})
+    return {
+        'alpha': breaker.get('ewma_alpha', 0.2),
+        'failure_threshold': breaker.get('failure_threshold', 5),
+        'cooldown': breaker.get('cooldown_seconds', 30.0)
+    }
+
+
+class Router:
+    """
+    Lazily initialized router: manifest, routing table and sentence encoder.
+    
+    Nothing is read or loaded until first use, so importing a module that
+    holds a Router is cheap. Call warmup() in a parent process before forking
+    workers so they inherit a loaded encoder instead of each loading their own.
+    
+    Prompt routing is a cascade when the manifest has a lexical stage and
+    `hparam.cascade_margin` is set: the encoder only runs for prompts the
+    lexical stage cannot separate clearly. `stage_counts` tallies which
+    stage decided. Any Encoder can replace the SentenceTransformer.
+    
+    The manifest and table live in an immutable RouterSnapshot. reload()
+    (or watch(), which polls the manifest) swaps in a new one without
+    blocking routing; live model stats and the loaded encoder carry over,
+    with the circuit-breaker and rate-limit settings of the new manifest.
+    """
+
+    def __init__(self, config_path: str = DEFAULT_CONFIG_PATH, embedding_model_name: str = None,
+                 embedding_cache=None, encoder: Encoder = None):
+        self.config_path = config_path
+        self.embedding_model_name = encoder.name if encoder is not None else embedding_model_name
+        self.embedding_cache = embedding_cache
+        self.startup_timings = {}
+        self.stage_counts = {'lexical': 0, 'embedding': 0}
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._snapshot = None
+        self._stats = None
+        self._limiter = None
+        # False once a limiter is set by hand; reload() then leaves it alone
+        self._limiter_from_config = True
+        self._encoder = encoder
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
+    @property
+    def snapshot(self) -> RouterSnapshot:
+        """Current router state, loaded on first access. Take it once per request."""
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._load_snapshot(self.startup_timings)
+        return self._snapshot
+
+    @property
+    def config(self) -> Dict:
+        """Router manifest of the current snapshot."""
+        return self.snapshot.config
+
+    @property
+    def table(self) -> RoutingTable:
+        """Routing table of the current snapshot."""
+        return self.snapshot.table
+
+    def _load_snapshot(self, timings: Dict = None) -> RouterSnapshot:
+        timings = {} if timings is None else timings
+        version = _file_version(self.config_path)
+        start = time.perf_counter()
+        config = load_config(self.config_path)
+        timings['config_load'] = time.perf_counter() - start
+        start = time.perf_counter()
+        table = RoutingTable.from_config(config, os.path.dirname(self.config_path) or '.')
+        timings['table_load'] = time.perf_counter() - start
+        return RouterSnapshot(config, table, version)
+
+    def reload(self) -> bool:
+        """
+        Build a new snapshot from the manifest on disk and swap it in.
+        
+        Routing continues on the old snapshot while the new table is built.
+        If the manifest or its data files fail to load or verify, or it names
+        a different embedding model than the loaded encoder, the current
+        snapshot is kept. Circuit-breaker and rate-limit settings follow the
+        new manifest; per-model statistics and bucket levels carry over.
+        
+        Returns:
+            True if a new snapshot was swapped in
+        """
+        with self._reload_lock:
+            try:
+                snapshot = self._load_snapshot()
+            except Exception as e:
+                logger.warning("[RELOAD] Keeping current router, could not load %s: %s", self.config_path, e)
+                return False
+            name = snapshot.config.get('optional', {}).get('embedding_model', DEFAULT_EMBEDDING_MODEL)
+            if isinstance(self._encoder, SentenceTransformerEncoder) and self._encoder.name != name:
+                logger.warning("[RELOAD] Keeping current router: embedding model changed from %s to %s, "
+                               "which needs a restart", self._encoder.name, name)
+                return False
+            self._snapshot = snapshot
+            optional = snapshot.config.get('optional', {})
+            if self._stats is not None:
+                self._stats.configure(**_breaker_settings(optional))
+            if self._limiter is not None and self._limiter_from_config:
+                self._limiter.reconfigure(optional.get('rate_limits'))
+            self.reloads += 1
+            logger.info("[RELOAD] Router reloaded from %s (%d models)", self.config_path, len(snapshot.table.models))
+            return True
+
+    def watch(self, interval: float = 2.0) -> threading.Thread:
+        """
+        Reload in a background thread whenever the manifest file changes.
+        
+        The manifest is replaced last when generate_config.py writes a router,
+        so a change to it means a complete new router is on disk.
+        """
+        with self._lock:
+            if self._watcher is not None:
+                return self._watcher
+            self._stop_watching.clear()
+            self._watcher = threading.Thread(target=self._watch, args=(interval,), name='router-watch',
+                                             daemon=True)
+            self._watcher.start()
+            return self._watcher
+
+    def stop_watching(self):
+        """Stop the watch() thread."""
+        with self._lock:
+            watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            self._stop_watching.set()
+            watcher.join()
+
+    def _watch(self, interval: float):
+        seen = self.snapshot.version
+        while not self._stop_watching.wait(interval):
+            try:
+                version = _file_version(self.config_path)
+            except OSError:
+                continue
+            # A failed version is not retried until the file changes again
+            if version != seen:
+                seen = version
+                if version != self.snapshot.version:
+                    self.reload()
+
+    @property
+    def stats(self) -> ModelStats:
+        """Live per-model statistics, configured from `optional.circuit_breaker`."""
+        if self._stats is None:
+            settings = _breaker_settings(self.config.get('optional', {}))
+            with self._lock:
+                if self._stats is None:
+                    self._stats = ModelStats(**settings)
+        return self._stats
+
+    @property
+    def limiter(self) -> RateLimiter:
+        """Client-side rate limits per model and API key, configured from `optional.rate_limits`."""
+        if self._limiter is None:
+            limits = self.config.get('optional', {}).get('rate_limits')
+            with self._lock:
+                if self._limiter is None:
+                    self._limiter = RateLimiter.from_config(limits)
+        return self._limiter
+
+    @limiter.setter
+    def limiter(self, limiter: RateLimiter):
+        self._limiter = limiter
+        self._limiter_from_config = False
+
+    @property
+    def encoder(self) -> Encoder:
+        """Encoder passed in, or the SentenceTransformer named in the manifest loaded on first access."""
+        if self._encoder is None:
+            name = self.embedding_model_name or self.config.get('optional', {}).get(
+                'embedding_model', DEFAULT_EMBEDDING_MODEL)
+            with self._lock:
+                if self._encoder is None:
+                    start = time.perf_counter()
+                    encoder = SentenceTransformerEncoder(name)
+                    encoder.model
+                    self._encoder = encoder
+                    self.embedding_model_name = name
+                    self.startup_timings['encoder_load'] = time.perf_counter() - start
+        return self._encoder
+
+    def warmup(self) -> Dict[str, float]:
+        """Load everything and run one dummy encode; returns the startup timings."""
+        self.table
+        encoder = self.encoder
+        start = time.perf_counter()
+        encoder.encode(['warmup'])
+        self.startup_timings['warmup'] = time.perf_counter() - start
+        return dict(self.startup_timings)
+
+    def encode(self, prompts: List[str], batch_size: int = 64) -> np.ndarray:
+        """Embed prompts in one batch, skipping the encoder for cached prompts."""
+        if self.embedding_cache is None:
+            return self.encoder.encode(prompts, batch_size=batch_size)
+        encoder = self.encoder
+        return self.embedding_cache.encode(
+            prompts, self.embedding_model_name,
+            lambda missing: encoder.encode(missing, batch_size=batch_size)
+        )
+
+    def add_exemplars(self, prompts: List[str], best_models: List[str], quality: List[float] = None,
+                      cost: List[float] = None) -> int:
+        """
+        Add labeled exemplar queries to the live index (created on first use).
+        
+        Readers holding the current snapshot are unaffected; the index is
+        copied, so each call costs O(index size) and adds should be batched.
+        Routing switches to k-NN voting once `min_exemplars` exist.
+        
+        Args:
+            prompts: Example queries
+            best_models: Model that answered each query best
+            quality: Observed quality per query (default 1.0)
+            cost: Observed cost per query (default 0.0)
+            
+        Returns:
+            Number of exemplars in the index
+        """
+        embeddings = self.encode(prompts)
+        # Snapshots are immutable: copy the index, add to the copy and swap in a new snapshot,
+        # as reload() does. Exemplars added here are not kept across reload().
+        with self._reload_lock:
+            snapshot = self.snapshot
+            table = snapshot.table
+            if table.exemplars is None:
+                exemplars = ExemplarIndex(table.models, embeddings.shape[1])
+            else:
+                exemplars = table.exemplars.copy()
+            exemplars.add(embeddings, best_models, quality, cost)
+            self._snapshot = RouterSnapshot(snapshot.config, table.with_exemplars(exemplars), snapshot.version)
+            return len(exemplars)
+
+    def route_prompt(self, prompt: str) -> Tuple[str, Dict]:
+        """Route one prompt; returns the selected model and its scores."""
+        return self.rank_cascade([prompt])[0][0]
+
+    def route_batch(self, prompts: List[str], batch_size: int = 64) -> List[Tuple[str, Dict]]:
+        """Route many prompts with one padded encode and one matrix product."""
+        return [ranked[0] for ranked in self.rank_cascade(prompts, batch_size)]
+
+    def rank_prompt(self, prompt: str) -> List[Tuple[str, Dict]]:
+        """All candidate models for one prompt, best first."""
+        return self.rank_cascade([prompt])[0]
+
+    def rank_lexical(self, prompts: List[str],
+                     table: RoutingTable = None) -> List[Optional[List[Tuple[str, Dict]]]]:
+        """
+        First cascade stage: rank models from hashed n-gram vectors only.
+        
+        Returns:
+            Per prompt, the ranked candidates if the margin between the top two
+            combined scores is at least `cascade_margin`, otherwise None (the
+            prompt needs the encoder). All None when there is no lexical stage.
+        """
+        table = table or self.table
+        if not prompts or not table.has_lexical_stage:
+            return [None] * len(prompts)
+        vectors = table.lexical_encoder.encode(prompts)
+        decided = []
+        for ranked in table.rank_batch(vectors, table.live_adjustments(self.stats), lexical=True):
+            margin = ranked[0][1]['combined_score'] - ranked[1][1]['combined_score'] if len(ranked) > 1 else np.inf
+            decided.append(ranked if margin >= table.cascade_margin else None)
+        with self._lock:
+            # Undecided prompts are counted by rank_embeddings() once encoded
+            self.stage_counts['lexical'] += sum(ranked is not None for ranked in decided)
+        return decided
+
+    def rank_cascade(self, prompts: List[str], batch_size: int = 64) -> List[List[Tuple[str, Dict]]]:
+        """Ranked candidates per prompt, encoding only the prompts the lexical stage left undecided."""
+        # Both stages use the same snapshot even if a reload lands in between
+        table = self.table
+        rankings = self.rank_lexical(prompts, table)
+        undecided = [row for row, ranked in enumerate(rankings) if ranked is None]
+        if undecided:
+            encoded = self.rank_embeddings(self.encode([prompts[row] for row in undecided], batch_size), table)
+            for row, ranked in zip(undecided, encoded):
+                rankings[row] = ranked
+        return rankings
+
+    def rank_embeddings(self, prompt_embeddings, table: RoutingTable = None) -> List[List[Tuple[str, Dict]]]:
+        """Ranked (model, scores) candidates for each already-encoded prompt."""
+        table = table or self.table
+        with self._lock:
+            self.stage_counts['embedding'] += len(prompt_embeddings)
+        return table.rank_batch(prompt_embeddings, table.live_adjustments(self.stats))
+
+    def route_embeddings(self, prompt_embeddings) -> List[Tuple[str, Dict]]:
+        """Route already-encoded prompts; one (selected model, scores) pair per row."""
+        return [ranked[0] for ranked in self.rank_embeddings(prompt_embeddings)]
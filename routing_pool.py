@@ -0,0 +1,116 @@
+"""Multi-process serving: a supervisor that spreads prompts over worker processes sharing one router."""
+import concurrent.futures
+import multiprocessing
+import os
+import sys
+from typing import Dict, List, Optional
+
+import orchestrator
+from openrouter_client import OpenRouterClient
+
+
+def _init_worker():
+    """Runs once in each worker process."""
+    # Each worker is one core; torch's own thread pool would oversubscribe (and is not fork-safe)
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(1)
+    # Sockets, threads and SQLite connections do not survive fork; give the worker its own
+    # client, hedge pool and embedding-cache connection
+    orchestrator.client = OpenRouterClient()
+    orchestrator._hedge_pool = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix='hedge')
+    orchestrator.embedding_cache.reopen()
+
+
+def _route_chunk(prompts: List[str]) -> List[tuple]:
+    return orchestrator.route_batch(prompts)
+
+
+def _orchestrate_chunk(args) -> List[Dict]:
+    prompts, kwargs = args
+    return orchestrator.orchestrate_many(prompts, **kwargs)
+
+
+class RoutingPool:
+    """
+    Supervisor for a pool of routing/orchestration worker processes.
+
+    The router's data files (model matrix, scales, lexical centroids and
+    exemplar embeddings) are memory-mapped .npy files, so every worker maps
+    the same page-cache pages instead of holding its own copy. With the
+    'fork' start method (the default where available) the parent warms the
+    router up first, and workers also inherit the loaded encoder weights
+    copy-on-write rather than each loading them. Start the pool before the
+    parent begins serving requests from other threads.
+
+    Prompts are sent to workers in chunks of `chunk_size`; each chunk is
+    encoded as one batch. Results come back in input order.
+    """
+
+    def __init__(self, processes: Optional[int] = None, chunk_size: int = 16, start_method: Optional[str] = None):
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        if start_method is None:
+            start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.start_method = start_method
+        self._pool = None
+
+    def start(self) -> 'RoutingPool':
+        """Warm up the router in this process (when forking), then start the workers."""
+        if self._pool is None:
+            if self.start_method == 'fork':
+                orchestrator.warmup()
+            context = multiprocessing.get_context(self.start_method)
+            self._pool = context.Pool(self.processes, initializer=_init_worker)
+        return self
+
+    def _chunks(self, prompts: List[str]) -> List[List[str]]:
+        return [prompts[i:i + self.chunk_size] for i in range(0, len(prompts), self.chunk_size)]
+
+    def route(self, prompts: List[str]) -> List[tuple]:
+        """(selected model, scores) for every prompt, routed in the workers."""
+        self.start()
+        return [item for chunk in self._pool.imap(_route_chunk, self._chunks(prompts)) for item in chunk]
+
+    def orchestrate(self, prompts: List[str], **kwargs) -> List[Dict]:
+        """
+        orchestrate_many() spread over the workers.
+
+        Args:
+            prompts: The input prompts to route and process
+            **kwargs: Passed to orchestrate_many() (use_cache, fallback, hedge, ...)
+
+        Returns:
+            One result per prompt in input order; failed prompts carry an "error" key
+        """
+        self.start()
+        chunks = [(chunk, kwargs) for chunk in self._chunks(prompts)]
+        return [item for chunk in self._pool.imap(_orchestrate_chunk, chunks) for item in chunk]
+
+    def memory(self) -> List[Dict[str, int]]:
+        """Resident and proportional set size (kB) of each worker; PSS splits shared pages between sharers."""
+        report = []
+        for child in multiprocessing.active_children():
+            entry = {'pid': child.pid}
+            try:
+                with open(f'/proc/{child.pid}/smaps_rollup') as f:
+                    for line in f:
+                        key, _, value = line.partition(':')
+                        if key in ('Rss', 'Pss'):
+                            entry[key.lower() + '_kb'] = int(value.split()[0])
+            except OSError:
+                pass
+            report.append(entry)
+        return report
+
+    def close(self):
+        """Stop the workers after they finish queued work."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self) -> 'RoutingPool':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,227 @@
+"""Local routing service: HTTP (TCP or Unix socket) front end with dynamic micro-batching."""
+import argparse
+import json
+import logging
+import os
+import queue
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+from router import DEFAULT_CONFIG_PATH, Router
+
+# Listen backlog; socketserver's default of 5 resets connections from bursts of clients
+LISTEN_BACKLOG = 1024
+
+
+class MicroBatcher:
+    """
+    Groups single requests into batches for one batched call.
+
+    A background thread takes the first waiting request, then keeps
+    collecting until it has `max_batch_size` requests or `max_wait` seconds
+    have passed since the first one, and runs `batch_fn` once for the
+    whole group. submit() returns a Future for each request's result.
+    """
+
+    def __init__(self, batch_fn: Callable[[List], List], max_batch_size: int = 32, max_wait: float = 0.005):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._max_batch = 0
+        self._max_queue_depth = 0
+        self._queue_wait = 0.0
+        self._batch_time = 0.0
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        depth = self._queue.qsize()
+        with self._lock:
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+        return future
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.perf_counter() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                try:
+                    entry = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch: List):
+        started = time.perf_counter()
+        try:
+            results = self.batch_fn([item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        with self._lock:
+            self._requests += len(batch)
+            self._batches += 1
+            self._max_batch = max(self._max_batch, len(batch))
+            self._queue_wait += sum(started - enqueued_at for _, _, enqueued_at in batch)
+            self._batch_time += time.perf_counter() - started
+
+    def metrics(self) -> Dict:
+        """Queue depth, batch counts and average batch size / wait."""
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'requests': self._requests,
+                'batches': self._batches,
+                'avg_batch_size': self._requests / self._batches if self._batches else 0.0,
+                'max_batch_size_seen': self._max_batch,
+                'avg_queue_wait_ms': 1000 * self._queue_wait / self._requests if self._requests else 0.0,
+                'avg_batch_time_ms': 1000 * self._batch_time / self._batches if self._batches else 0.0,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': 1000 * self.max_wait
+            }
+
+    def close(self):
+        """Finish queued requests and stop the batching thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+class RoutingHandler(BaseHTTPRequestHandler):
+    """
+    POST /route  {"prompt": "..."} -> {"model", "routing", "candidates"}
+    GET  /metrics                  -> batcher and router stage metrics
+    GET  /health                   -> {"status": "ok"}
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, {'status': 'ok'})
+        elif self.path == '/metrics':
+            self._send(200, {**self.server.batcher.metrics(), 'stages': dict(self.server.router.stage_counts)})
+        else:
+            self._send(404, {'error': f'unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/route':
+            self._send(404, {'error': f'unknown path {self.path}'})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            prompt = body['prompt']
+        except (ValueError, KeyError, TypeError):
+            self._send(400, {'error': 'expected a JSON body {"prompt": "..."}'})
+            return
+        try:
+            ranked = self.server.batcher.submit(prompt).result(timeout=self.server.request_timeout)
+        except Exception as e:
+            self._send(500, {'error': str(e)})
+            return
+        model, routing = ranked[0]
+        self._send(200, {'model': model, 'routing': routing, 'candidates': [name for name, _ in ranked]})
+
+    def _send(self, status: int, payload: Dict):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        # Unix-socket peers have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RoutingHTTPServer(ThreadingHTTPServer):
+    request_queue_size = LISTEN_BACKLOG
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+def create_server(router: Router, host: str = '127.0.0.1', port: int = 8765, unix_socket: str = None,
+                  max_batch_size: int = 32, max_wait: float = 0.005, request_timeout: float = 30.0):
+    """
+    Build (but do not start) the routing service.
+
+    Args:
+        router: Router shared by every request
+        host, port: TCP address, ignored when `unix_socket` is given
+        unix_socket: Path of a Unix socket to listen on instead of TCP
+        max_batch_size: Most prompts encoded and scored together
+        max_wait: Longest a request waits for others to join its batch (seconds)
+        request_timeout: Seconds a request waits for its batch result
+
+    Returns:
+        A server; call serve_forever(), and batcher.close() after shutdown
+    """
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = UnixHTTPServer(unix_socket, RoutingHandler)
+    else:
+        server = RoutingHTTPServer((host, port), RoutingHandler)
+    server.router = router
+    server.batcher = MicroBatcher(router.rank_cascade, max_batch_size, max_wait)
+    server.request_timeout = request_timeout
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Local routing service with micro-batching')
+    parser.add_argument('--config', default=DEFAULT_CONFIG_PATH)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix-socket', help='listen on this Unix socket path instead of TCP')
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--watch', type=float, help='reload the router when the manifest changes (poll seconds)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    router = Router(args.config)
+    timings = router.warmup()
+    print(f"[SERVICE] Router warmed up: {timings}")
+    if args.watch:
+        router.watch(args.watch)
+    server = create_server(router, args.host, args.port, args.unix_socket,
+                           args.max_batch_size, args.max_wait_ms / 1000.0)
+    print(f"[SERVICE] Listening on {args.unix_socket or f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
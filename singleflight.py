@@ -0,0 +1,95 @@
+"""Single-flight request coalescing: concurrent calls with the same key share one execution."""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Thread-based single-flight group.
+
+    While a call for a key is in flight, other callers with the same key
+    wait for it and receive its result (or exception) instead of running
+    the function again. Nothing is cached once the call has finished.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn once per in-flight key; returns (result, shared) where shared is True for waiters."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'executed': self.executed, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    asyncio single-flight group; calls are only shared within one event loop.
+
+    The shared call is cancelled only when every caller waiting on it has
+    been cancelled, so one impatient caller cannot fail the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Await fn() once per in-flight key; returns (result, shared) where shared is True for waiters."""
+        loop_key = (id(asyncio.get_running_loop()), key)
+        entry = self._calls.get(loop_key)
+        shared = entry is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.executed += 1
+            entry = self._calls[loop_key] = [asyncio.ensure_future(fn()), 0]
+        future = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(future), shared
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not future.done():
+                future.cancel()
+            if (future.done() or entry[1] == 0) and self._calls.get(loop_key) is entry:
+                del self._calls[loop_key]
+
+    def stats(self) -> Dict[str, int]:
+        return {'executed': self.executed, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
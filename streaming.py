@@ -0,0 +1,128 @@
+"""Streamed completions that time themselves as they are consumed."""
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, Optional
+
+
+class StreamingResponse:
+    """
+    Iterator of completion text chunks.
+
+    While it is consumed it records `time_to_first_token` and, once the
+    stream ends, `generation_time` (both in seconds, measured from
+    `started_at`) into the given metadata dict. The joined text is then
+    available as `text` and is passed to `on_complete`, exactly once:
+    iterating or reading a finished stream just returns `text` again. If the
+    source raises partway, the error is passed to `on_error` once, kept as
+    `error` and raised again by any later read.
+    """
+
+    def __init__(self, chunks: Iterable[str], metadata: Dict, started_at: Optional[float] = None,
+                 on_complete: Optional[Callable[[str], None]] = None,
+                 on_error: Optional[Callable[[Exception], None]] = None):
+        # One iterator for the whole response, so a later read resumes instead of replaying
+        self._chunks = self._iterator(chunks)
+        self.metadata = metadata
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.on_complete = on_complete
+        self.on_error = on_error
+        self.text = None
+        self.error = None
+        # Chunks seen so far, kept across partial iterations (e.g. iterate a few, then read())
+        self._parts = []
+        self._done = False
+
+    @staticmethod
+    def _iterator(chunks):
+        return iter(chunks)
+
+    def __iter__(self):
+        if self._done:
+            if self.text:
+                yield self.text
+            return
+        if self.error is not None:
+            raise self.error
+        try:
+            for chunk in self._chunks:
+                self._record(chunk)
+                yield chunk
+        except Exception as e:
+            self._fail(e)
+            raise
+        self._finish()
+
+    def _record(self, chunk: str):
+        if not self._parts:
+            self.metadata['time_to_first_token'] = time.perf_counter() - self.started_at
+        self._parts.append(chunk)
+
+    def _finish(self):
+        if self._done:
+            return
+        self._done = True
+        self.metadata['generation_time'] = time.perf_counter() - self.started_at
+        self.text = ''.join(self._parts)
+        if self.on_complete is not None:
+            self.on_complete(self.text)
+
+    def _fail(self, error: Exception):
+        self.error = error
+        if self.on_error is not None:
+            self.on_error(error)
+
+    def read(self) -> str:
+        """Consume the rest of the stream and return the full text."""
+        for _ in self:
+            pass
+        return self.text
+
+
+class AsyncStreamingResponse(StreamingResponse):
+    """Async iterator counterpart of StreamingResponse."""
+
+    def __init__(self, chunks: AsyncIterator[str], metadata: Dict, started_at: Optional[float] = None,
+                 on_complete: Optional[Callable[[str], None]] = None,
+                 on_error: Optional[Callable[[Exception], None]] = None,
+                 on_close: Optional[Callable[[], None]] = None):
+        super().__init__(chunks, metadata, started_at, on_complete, on_error)
+        self.on_close = on_close
+
+    @staticmethod
+    def _iterator(chunks):
+        return chunks.__aiter__()
+
+    def __iter__(self):
+        raise TypeError("AsyncStreamingResponse must be consumed with 'async for'")
+
+    async def __aiter__(self):
+        if self._done:
+            if self.text:
+                yield self.text
+            return
+        if self.error is not None:
+            raise self.error
+        try:
+            async for chunk in self._chunks:
+                self._record(chunk)
+                yield chunk
+            self._finish()
+        except Exception as e:
+            self._fail(e)
+            raise
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        """Release the connection (and concurrency slot) without reading further."""
+        close = getattr(self._chunks, 'aclose', None)
+        if close is not None:
+            await close()
+        if self.on_close is not None:
+            self.on_close()
+            self.on_close = None
+
+    async def read(self) -> str:
+        """Consume the rest of the stream and return the full text."""
+        async for _ in self:
+            pass
+        return self.text
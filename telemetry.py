@@ -0,0 +1,218 @@
+"""Orchestrator metrics: stage timers, latency histograms, token/cost counters and a cProfile hook.
+
+Export with to_prometheus() (text exposition format) or snapshot() / to_json().
+"""
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(upper bound, observations at or below it) for every bucket, ending with +Inf."""
+        total, rows = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            rows.append((bound, total))
+        return rows
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (0-1), or None when empty."""
+        if not self.count:
+            return None
+        for bound, total in self.cumulative():
+            if total >= q * self.count:
+                return bound
+
+
+class Metrics:
+    """
+    Thread-safe registry of labelled counters and histograms.
+
+    Counters and histograms are recorded as requests run. Collectors are
+    callables run only at export time; each returns (name, labels, value)
+    gauges read from objects that already count things themselves (cache
+    hit counters, client retries), so the hot path pays nothing for them.
+    """
+
+    def __init__(self, prefix: str = 'router'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._profiler = None
+        self._profile_lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict) -> Tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """Add `value` to a counter."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record one observation (seconds) in a histogram."""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """Time a block into the `stage_seconds` histogram under label stage=`stage`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+    def add_collector(self, collector: Callable[[], List[Tuple[str, Dict, float]]]):
+        """Register a function returning (name, labels, value) gauges, called at export time."""
+        self._collectors.append(collector)
+
+    def _gauges(self) -> List[Tuple[str, Dict, float]]:
+        gauges = []
+        for collector in self._collectors:
+            gauges.extend(collector())
+        return gauges
+
+    def snapshot(self) -> Dict:
+        """Every counter, histogram (count, sum, approximate p50/p95/p99) and collected gauge."""
+        with self._lock:
+            counters = [(name, dict(labels), value) for (name, labels), value in self._counters.items()]
+            histograms = [
+                (name, dict(labels), {
+                    'count': h.count,
+                    'sum': h.sum,
+                    'p50': h.quantile(0.50),
+                    'p95': h.quantile(0.95),
+                    'p99': h.quantile(0.99)
+                })
+                for (name, labels), h in self._histograms.items()
+            ]
+        return {
+            'counters': [{'name': n, 'labels': l, 'value': v} for n, l, v in counters],
+            'histograms': [{'name': n, 'labels': l, **h} for n, l, h in histograms],
+            'gauges': [{'name': n, 'labels': l, 'value': v} for n, l, v in self._gauges()]
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                ((key, h.cumulative(), h.sum, h.count) for key, h in self._histograms.items()),
+                key=lambda item: item[0]
+            )
+        lines, typed = [], set()
+
+        def declare(name: str, kind: str):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            full = f'{self.prefix}_{name}_total'
+            declare(full, 'counter')
+            lines.append(f'{full}{_labels(labels)} {value!r}')
+        for (name, labels), buckets, total, count in histograms:
+            full = f'{self.prefix}_{name}'
+            declare(full, 'histogram')
+            for bound, cumulative in buckets:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{full}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{full}_sum{_labels(labels)} {total!r}')
+            lines.append(f'{full}_count{_labels(labels)} {count}')
+        for name, labels, value in self._gauges():
+            full = f'{self.prefix}_{name}'
+            declare(full, 'gauge')
+            lines.append(f'{full}{_labels(tuple(sorted(labels.items())))} {float(value)!r}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Drop recorded counters and histograms (collectors stay registered)."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def enable_profiling(self):
+        """Start collecting cProfile data for blocks run under profiled()."""
+        self._profiler = cProfile.Profile()
+
+    def disable_profiling(self) -> Optional[cProfile.Profile]:
+        """Stop profiling; returns the profile collected so far."""
+        profiler, self._profiler = self._profiler, None
+        return profiler
+
+    @contextmanager
+    def profiled(self):
+        """
+        Run a block under the cProfile profiler, if profiling is enabled.
+
+        cProfile follows one thread at a time, so a block entered while
+        another thread is being profiled runs unprofiled.
+        """
+        profiler = self._profiler
+        if profiler is None or not self._profile_lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+        finally:
+            self._profile_lock.release()
+
+    def profile_report(self, limit: int = 30, sort: str = 'cumulative') -> str:
+        """Top `limit` functions of the current profile as pstats text."""
+        if self._profiler is None:
+            return ''
+        out = io.StringIO()
+        with self._profile_lock:
+            pstats.Stats(self._profiler, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+def _labels(labels: Tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
@@ -0,0 +1,248 @@
+"""Upstream behaviour test - retries, streaming, rate-limit spill-over and the mock itself, against mock_openrouter.py.
+
+No API key or network is needed:
+
+    python test_mock_upstream.py
+"""
+import asyncio
+import os
+import sys
+import time
+import requests
+
+from mock_openrouter import MockOpenRouter
+
+# The orchestrator's shared client reads OPENROUTER_BASE_URL when it is imported
+mock = MockOpenRouter(latency=0.01, retry_after=0.2, reply_tokens=8, chunk_delay=0.001).start()
+os.environ['OPENROUTER_BASE_URL'] = mock.base_url
+os.environ.setdefault('OPENROUTER_API_KEY', 'mock-key')
+
+import benchmark
+import orchestrator
+from openrouter_client import AsyncOpenRouterClient, OpenRouterClient
+from rate_limiter import RateLimitExceeded, RateLimiter
+from streaming import StreamingResponse
+
+
+def reset_mock(**settings):
+    """Restore the mock's defaults (plus `settings`) and zero its counters."""
+    defaults = {'latency': 0.01, 'error_rate': 0.0, 'rate_limit_rate': 0.0, 'retry_after': 0.2}
+    for name, value in {**defaults, **settings}.items():
+        setattr(mock, name, value)
+    mock.counts = {'ok': 0, 'error': 0, 'rate_limited': 0, 'disconnect': 0}
+
+
+def check_mock():
+    """The mock answers, throttles and fails as configured, and streams one chunk per word."""
+    reset_mock()
+    client = OpenRouterClient(max_retries=0)
+    result = client.chat_completion('openai/gpt-4o-mini', [{"role": "user", "content": "hello"}])
+    assert result['usage']['completion_tokens'] == 8, result['usage']
+    assert result['choices'][0]['message']['content'].startswith('openai/gpt-4o-mini-token0')
+
+    chunks = list(client.stream_completion('hello', 'openai/gpt-4o-mini'))
+    assert len(chunks) == 8, chunks
+
+    mock.queue_outcomes('error', 'rate_limited')
+    for status in (503, 429):
+        try:
+            client.complete('hello', 'openai/gpt-4o-mini')
+        except requests.HTTPError as e:
+            assert e.response.status_code == status, e.response.status_code
+        else:
+            raise AssertionError(f"expected HTTP {status}")
+    assert mock.counts == {'ok': 2, 'error': 1, 'rate_limited': 1, 'disconnect': 0}, mock.counts
+    client.close()
+
+
+def check_retries():
+    """429 and 5xx are retried, honoring Retry-After; a read timeout is not retried."""
+    reset_mock()
+    client = OpenRouterClient(max_retries=3, backoff_base=0.01)
+    mock.queue_outcomes('rate_limited', 'error')
+    start = time.perf_counter()
+    client.complete('hello', 'openai/gpt-4o-mini')
+    elapsed = time.perf_counter() - start
+    assert client.retries == 2, client.retries
+    assert mock.counts == {'ok': 1, 'error': 1, 'rate_limited': 1, 'disconnect': 0}, mock.counts
+    assert elapsed >= mock.retry_after, f"Retry-After ignored: {elapsed:.3f}s"
+
+    # The completion may already be running upstream, so a timed-out read must not be sent again
+    reset_mock(latency=0.5)
+    client = OpenRouterClient(max_retries=3, read_timeout=0.1, backoff_base=0.01)
+    try:
+        client.complete('hello', 'openai/gpt-4o-mini')
+    except requests.ReadTimeout:
+        pass
+    else:
+        raise AssertionError("expected ReadTimeout")
+    assert client.retries == 0, client.retries
+    assert sum(mock.counts.values()) == 1, mock.counts
+
+    reset_mock(latency=0.5)
+    asyncio.run(_check_async_read_timeout())
+    assert sum(mock.counts.values()) == 1, mock.counts
+    reset_mock()
+
+
+async def _check_async_read_timeout():
+    import httpx
+
+    client = AsyncOpenRouterClient(max_retries=3, read_timeout=0.1, backoff_base=0.01)
+    try:
+        await client.complete('hello', 'openai/gpt-4o-mini')
+    except httpx.ReadTimeout:
+        pass
+    else:
+        raise AssertionError("expected ReadTimeout")
+    finally:
+        await client.aclose()
+    assert client.retries == 0, client.retries
+
+
+def check_streaming():
+    """A stream read again after it finished returns the same text and records its stats only once."""
+    reset_mock()
+    result = orchestrator.orchestrate("Write a haiku about stars", use_cache=False, stream=True)
+    model = result["model_used"]
+    before = orchestrator.router.stats.snapshot().get(model, {}).get('requests', 0)
+
+    stream = result["response"]
+    chunks = list(stream)
+    text = stream.read()
+    again = list(stream)
+    assert text == ''.join(chunks), (text, chunks)
+    assert again == [text], again
+    assert len(chunks) == 8, chunks
+    assert result["routing_metadata"]["completion_tokens"] > 0
+
+    after = orchestrator.router.stats.snapshot()[model]['requests']
+    assert after == before + 1, f"on_complete ran {after - before} times"
+
+
+def check_stream_failure():
+    """A stream cut off mid-body counts as a model failure, so a half-open probe re-opens the breaker."""
+    reset_mock()
+    stream = StreamingResponse(['a', 'b', 'c'], {})
+    assert next(iter(stream)) == 'a'
+    assert stream.read() == 'abc', stream.text
+
+    stats = orchestrator.router.stats
+    candidate = orchestrator.rank_prompt("Write a haiku about stars")[0]
+    model = candidate[0]
+    for _ in range(stats.failure_threshold):
+        stats.record_failure(model)
+    stats._models[model]['open_until'] = time.monotonic() - 1.0
+    failures = stats.snapshot()[model]['failures']
+    try:
+        mock.queue_outcomes('disconnect')
+        result = orchestrator._complete("Write a haiku about stars", [candidate], use_cache=False, stream=True,
+                                        fallback=False)
+        try:
+            result["response"].read()
+        except requests.RequestException:
+            pass
+        else:
+            raise AssertionError("expected the cut-off stream to raise")
+        assert mock.counts['disconnect'] == 1, mock.counts
+        assert stats.snapshot()[model]['failures'] == failures + 1, stats.snapshot()[model]
+        assert stats._models[model]['open_until'] > time.monotonic(), "probe failure did not re-open the breaker"
+        assert stats._models[model]['probe_started'] is None
+        try:
+            result["response"].read()
+        except requests.RequestException:
+            pass
+        else:
+            raise AssertionError("a failed stream must keep failing")
+        assert stats.snapshot()[model]['failures'] == failures + 1, "failure recorded twice"
+    finally:
+        stats._models[model].update(open_until=0.0, probe_started=None)
+
+
+def check_spill():
+    """Throttling spills over to a cheaper candidate, never to a more expensive one."""
+    reset_mock()
+    by_cost = sorted(orchestrator.rank_prompt("Summarize gravity"), key=lambda candidate: candidate[1]['cost'])
+    cheapest, priciest = by_cost[0], by_cost[-1]
+    previous = orchestrator.router.limiter
+    try:
+        # The priciest model is throttled: its request spills over to the cheapest
+        orchestrator.router.limiter = throttled(priciest[0])
+        result = orchestrator._complete("Summarize gravity", [priciest, cheapest] + by_cost[1:-1], use_cache=False)
+        assert result["model_used"] == cheapest[0], result["model_used"]
+        assert result["routing_metadata"]["spilled_from"] == [priciest[0]], result["routing_metadata"]
+
+        # The cheapest model is throttled: every other candidate costs more, so the request fails
+        orchestrator.router.limiter = throttled(cheapest[0])
+        reset_mock()
+        try:
+            result = orchestrator._complete("Summarize gravity", [cheapest, priciest] + by_cost[1:-1],
+                                            use_cache=False)
+        except RateLimitExceeded:
+            pass
+        else:
+            raise AssertionError(f"spilled from {cheapest[0]} to pricier {result['model_used']}")
+        assert sum(mock.counts.values()) == 0, mock.counts
+    finally:
+        orchestrator.router.limiter = previous
+
+
+def throttled(model: str) -> RateLimiter:
+    """Limiter whose next request to `model` would wait ~10s, past both spill_wait and max_wait."""
+    limiter = RateLimiter(model_limits={model: {'requests_per_second': 0.1}}, max_wait=1.0, spill_wait=0.05)
+    limiter.acquire(model)
+    return limiter
+
+
+def check_hedge():
+    """A hedged runner-up still waiting on its rate limit when the primary answers is never sent."""
+    reset_mock(latency=0.3)
+    primary, runner_up = orchestrator.rank_prompt("Summarize gravity")[:2]
+    previous = orchestrator.router.limiter
+    try:
+        orchestrator.router.limiter = RateLimiter(model_limits={runner_up[0]: {'requests_per_second': 1}})
+        orchestrator.router.limiter.acquire(runner_up[0])
+        result = orchestrator._complete("Summarize gravity", [primary, runner_up], use_cache=False,
+                                        hedge=True, hedge_delay=0.05)
+        assert result["routing_metadata"]["hedge_winner"] == "primary", result["routing_metadata"]
+        # The runner-up's rate-limit wait (~1s) ends after the primary answered
+        time.sleep(1.2)
+        assert sum(mock.counts.values()) == 1, mock.counts
+    finally:
+        orchestrator.router.limiter = previous
+        reset_mock()
+
+
+def check_benchmark():
+    """The orchestrate suite runs cleanly against the mock, and compare() flags a slowdown."""
+    reset_mock()
+    results = benchmark.bench_orchestrate([4], 16, False, seed=0)
+    for name in ('threads_4', 'async_4'):
+        assert results[name]['errors'] == 0, results[name]
+        assert results[name]['count'] == 16, results[name]
+    assert mock.counts['ok'] == 32, mock.counts
+
+    lines = benchmark.compare({'results': {'routing': {'p50_ms': 1.0}}}, {'results': {'routing': {'p50_ms': 2.0}}})
+    assert len(lines) == 1 and lines[0].startswith('REGRESSION'), lines
+
+
+CHECKS = [check_mock, check_retries, check_streaming, check_stream_failure, check_spill, check_hedge,
+          check_benchmark]
+
+if __name__ == "__main__":
+    print("=" * 70)
+    print(f"UPSTREAM TEST (mock at {mock.base_url})")
+    print("=" * 70)
+    failed = 0
+    for check in CHECKS:
+        print(f"\n[CHECK] {check.__doc__}")
+        try:
+            check()
+            print("  [PASS]")
+        except Exception as e:
+            failed += 1
+            print(f"  [FAIL] {type(e).__name__}: {e}")
+    mock.stop()
+    print("\n" + "=" * 70)
+    print(f"{len(CHECKS) - failed}/{len(CHECKS)} checks passed")
+    sys.exit(1 if failed else 0)
@@ -1,6 +1,10 @@
 """Step 10: Multi-prompt test - Test orchestrate() with 3 different prompts."""
-from orchestrator import orchestrate
+from orchestrator import orchestrate_many
 import json
+import logging
+
+# Show the orchestrator's [ROUTING] log lines
+logging.basicConfig(level=logging.INFO, format='%(message)s')
 
 # Test prompts
 prompts = [
@@ -15,31 +19,33 @@ print("="*70)
 
 results = []
 
-for i, prompt in enumerate(prompts, 1):
+# Route all prompts in one batch, then call OpenRouter for each
+batch_results = orchestrate_many(prompts)
+
+for i, (prompt, result) in enumerate(zip(prompts, batch_results), 1):
     print(f"\n{'='*70}")
     print(f"TEST {i}/3")
     print(f"{'='*70}")
     
-    try:
-        result = orchestrate(prompt)
+    if "error" in result:
+        print(f"\n[ERROR] Failed to process prompt: {result['error']}")
         results.append({
             "prompt": prompt,
-            "model_used": result["model_used"],
-            "response_preview": result["response"][:150] + "..." if len(result["response"]) > 150 else result["response"],
-            "estimated_cost": result["estimated_cost"],
-            "routing_metadata": result["routing_metadata"]
-        })
-        
-        print(f"\n[RESULT] Model: {result['model_used']}")
-        print(f"[RESULT] Estimated Cost: ${result['estimated_cost']:.6f}")
-        print(f"[RESULT] Response Preview: {result['response'][:200]}...")
-        
-    except Exception as e:
-        print(f"\n[ERROR] Failed to process prompt: {e}")
-        results.append({
-            "prompt": prompt,
-            "error": str(e)
+            "error": result["error"]
         })
+        continue
+    
+    results.append({
+        "prompt": prompt,
+        "model_used": result["model_used"],
+        "response_preview": result["response"][:150] + "..." if len(result["response"]) > 150 else result["response"],
+        "estimated_cost": result["estimated_cost"],
+        "routing_metadata": result["routing_metadata"]
+    })
+    
+    print(f"\n[RESULT] Model: {result['model_used']}")
+    print(f"[RESULT] Estimated Cost: ${result['estimated_cost']:.6f}")
+    print(f"[RESULT] Response Preview: {result['response'][:200]}...")
 
 print(f"\n{'='*70}")
 print("SUMMARY")
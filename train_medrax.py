@@ -1,5 +1,5 @@
+import argparse
 import dspy
-import json
 import os
 import sys
 
@@ -8,14 +8,28 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.signatures import MedRAXSignature
 from src.tools import MedRAXTools
+from medrax_cache import CachedLM, CallCache
+from medrax_data import iter_samples
+
+parser = argparse.ArgumentParser(description='Compile the MedRAX agent with MIPROv2')
+parser.add_argument('--data', help='training samples, JSON array or .jsonl (default: ../data/train_samples.json)')
+parser.add_argument('--shard', type=int, default=0, help='train on shard SHARD of --num-shards')
+parser.add_argument('--num-shards', type=int, default=1)
+parser.add_argument('--limit', type=int, help='use at most this many samples')
+parser.add_argument('--cache', default=os.path.join(os.path.dirname(__file__), '../results/medrax_cache.sqlite'),
+                    help='tool / LM call cache (default: ../results/medrax_cache.sqlite)')
+parser.add_argument('--cache-max-mb', type=int, default=1024)
+parser.add_argument('--no-cache', action='store_true', help='call tools and LMs directly')
+parser.add_argument('--offline', action='store_true', help='serve every call from the cache; a miss is an error')
+parser.add_argument('--task-model', default='gpt-4o-mini',
+                    help='LM the agent runs on, unless one is already configured in dspy.settings')
+args = parser.parse_args()
 
 # 1. Load Data
-def load_data(file_path):
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-    
+def load_data(file_path, shard=0, num_shards=1, limit=None):
+    # Samples are streamed from disk, so only the kept shard is ever held in memory
     examples = []
-    for item in data:
+    for item in iter_samples(file_path, shard, num_shards, limit):
         # Create dspy.Example
         # Inputs: clinical_context, image_path, question
         # Labels: reasoning (gold_reasoning), answer
@@ -29,21 +43,38 @@ def load_data(file_path):
         examples.append(example)
     return examples
 
-data_path = os.path.join(os.path.dirname(__file__), '../data/train_samples.json')
+data_path = args.data or os.path.join(os.path.dirname(__file__), '../data/train_samples.json')
 print(f"Loading data from {data_path}...")
-train_data = load_data(data_path)
+train_data = load_data(data_path, args.shard, args.num_shards, args.limit)
 print(f"Loaded {len(train_data)} examples.")
 
+# Candidate programs re-run the same tools on the same images and repeat the same LM prompts;
+# cache both across candidates and across runs
+if args.no_cache and args.offline:
+    parser.error('--offline needs the cache')
+cache = None
+if not args.no_cache:
+    cache = CallCache(args.cache, args.cache_max_mb * 1024 * 1024, offline=args.offline)
+    print(f"Using call cache {args.cache}{' (offline)' if args.offline else ''}")
+
+# The agent's LM is configured here so its calls go through the cache too
+task_lm = dspy.settings.lm or dspy.OpenAI(model=args.task_model)
+if cache is not None:
+    task_lm = CachedLM(task_lm, cache)
+dspy.settings.configure(lm=task_lm)
+print(f"Task LM: {task_lm.kwargs.get('model', type(task_lm).__name__)}")
+
 # 2. Define the Agent
 # We use ReAct, which allows the model to "Think" and "Act" (use tools)
 print("Initializing MedRAX Agent...")
-medrax_agent = dspy.ReAct(MedRAXSignature, tools=[MedRAXTools.chexagent_detect, MedRAXTools.medsam_segment])
+tools = [MedRAXTools.chexagent_detect, MedRAXTools.medsam_segment]
+if cache is not None:
+    tools = [cache.wrap_tool(tool) for tool in tools]
+medrax_agent = dspy.ReAct(MedRAXSignature, tools=tools)
 
 # 3. Define Success Metric
-# If the agent's answer matches the gold standard, it gets a point.
-def medical_accuracy_metric(example, prediction, trace=None):
-    # Simple containment check as per blueprint
-    return example.answer.lower() in prediction.answer.lower()
+# If the agent's answer matches the gold standard, it gets a point (shared with evaluate.py)
+from medrax_metrics import medical_accuracy_metric
 
 # 4. Optimize (The "Training" Step)
 # MIPROv2 will generate new instructions and few-shot examples to maximize the metric
@@ -51,7 +82,10 @@ from dspy.teleprompt import MIPROv2
 
 print("Initializing Optimizer (MIPROv2)...")
 # Note: This expects OPENAI_API_KEY to be set in the environment
-optimizer = MIPROv2(metric=medical_accuracy_metric, prompt_model=dspy.OpenAI(model='gpt-4o'))
+prompt_model = dspy.OpenAI(model='gpt-4o')
+if cache is not None:
+    prompt_model = CachedLM(prompt_model, cache)
+optimizer = MIPROv2(metric=medical_accuracy_metric, prompt_model=prompt_model, task_model=task_lm)
 
 print("Starting Optimization...")
 # This step takes time: It runs the agent many times to find the best prompt
@@ -64,3 +98,7 @@ output_path = os.path.join(results_dir, "medrax_compiled.json")
 compiled_medrax.save(output_path)
 
 print(f"Optimization Complete. Compiled program saved to {output_path}")
+if cache is not None:
+    for line in cache.report():
+        print(f"[CACHE] {line}")
+    cache.close()